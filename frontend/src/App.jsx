@@ -10,6 +10,7 @@ import {
 } from 'lucide-react'
 
 const API = 'http://localhost:8000'
+const OPTIMIZE_TIMEOUT_MS = 120000  // give up polling a solver job after 2 min
 
 /* ─── Physics ─────────────────────────────────────────────────── */
 const LAMBDA = 0.1155
@@ -398,7 +399,19 @@ export default function App() {
 
             const r = await fetch(`${API}/optimize`, { method: 'POST', headers, body })
             if (!r.ok) throw new Error('Optimization failed')
-            const data = await r.json()
+            const { job_id } = await r.json()
+
+            // Solver runs as a background job; poll until it reports DONE or the deadline passes
+            const deadline = Date.now() + OPTIMIZE_TIMEOUT_MS
+            let data
+            for (;;) {
+                if (Date.now() > deadline) throw new Error('Optimization timed out')
+                await new Promise(res => setTimeout(res, 1000))
+                const jr = await fetch(`${API}/optimize/${job_id}`)
+                if (!jr.ok) throw new Error('Optimization failed')
+                data = await jr.json()
+                if (data.status === 'DONE') break
+            }
 
             const rd = data.routes ?? data
             const an = data.analytics ?? null
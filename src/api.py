@@ -1,11 +1,15 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from typing import Optional
+from fastapi.responses import ORJSONResponse
+from typing import Dict, Optional, Tuple
 from pydantic import BaseModel
 import sys
 import os
-import json
 import logging
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from uuid import uuid4
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
@@ -16,7 +20,15 @@ from src.core.simulator_dynamic import DynamicSimulator
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("API")
 
-app = FastAPI(title="Medical Isotope Dispatch API")
+app = FastAPI(title="Medical Isotope Dispatch API", default_response_class=ORJSONResponse)
+
+# Solves run in worker processes: OR-Tools search is CPU-bound and would otherwise block request handling
+_EXECUTOR = ProcessPoolExecutor()
+# job_id -> (future, submitted_at). Jobs are dropped once their result is fetched, or
+# JOB_TTL_S after submission if the client never comes back for them
+_JOBS: Dict[str, Tuple[Future, float]] = {}
+_JOBS_LOCK = threading.Lock()  # sync handlers run concurrently on FastAPI's threadpool
+JOB_TTL_S = 15 * 60
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,39 +60,57 @@ def get_hospitals():
         for h in hospitals
     ]
 
+def run_optimizer(avoid_dict: Optional[dict] = None) -> dict:
+    """Runs one full optimisation; top-level so it can be pickled into a worker process."""
+    optimizer = IsotopeOptimizer()
+    # The payload is returned in memory; output/routes.json is only written for debugging
+    payload = optimizer.solve_and_report(avoid_point=avoid_dict, write=bool(os.getenv("DEBUG_ROUTES")))
+    if payload is None:
+        raise RuntimeError("Optimization failed to produce output.")
+    return payload
+
 @app.post("/optimize")
 def optimize_routes(request: Optional[OptimizeRequest] = None):
-    """Triggers solver. Returns { routes: [...], analytics: {...} }."""
-    try:
-        optimizer = IsotopeOptimizer()
-        
-        avoid_dict = None
-        if request and request.avoid_point:
-            avoid_dict = {"lat": request.avoid_point.lat, "lon": request.avoid_point.lon}
-            
-        optimizer.solve_and_report(avoid_point=avoid_dict)
-        
-        if os.path.exists("output/routes.json"):
-            with open("output/routes.json", 'r') as f:
-                data = json.load(f)
-            return data
-        else:
-             raise HTTPException(status_code=500, detail="Optimization failed to produce output.")
-    except Exception as e:
-        logger.error(f"Optimization error: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+    """Submits a solver job. Returns { job_id, status }; poll GET /optimize/{job_id} for the result."""
+    avoid_dict = None
+    if request and request.avoid_point:
+        avoid_dict = {"lat": request.avoid_point.lat, "lon": request.avoid_point.lon}
+
+    job_id = str(uuid4())
+    future = _EXECUTOR.submit(run_optimizer, avoid_dict)
+    now = time.monotonic()
+    with _JOBS_LOCK:
+        for stale in [jid for jid, (f, t) in _JOBS.items() if f.done() and now - t > JOB_TTL_S]:
+            del _JOBS[stale]
+        _JOBS[job_id] = (future, now)
+    return {"job_id": job_id, "status": "PENDING"}
+
+@app.get("/optimize/{job_id}")
+def get_optimize_job(job_id: str):
+    """Returns { job_id, status: PENDING|RUNNING|DONE }, plus { routes, analytics } once DONE (fetchable once)."""
+    with _JOBS_LOCK:
+        job = _JOBS.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"Unknown optimization job: {job_id}")
+        future = job[0]
+        if not future.done():
+            return {"job_id": job_id, "status": "RUNNING" if future.running() else "PENDING"}
+        # Finished: the result (or error) is handed out once, then the job is forgotten
+        del _JOBS[job_id]
+
+    error = future.exception()
+    if error is not None:
+        logger.error(f"Optimization error: {error}", exc_info=error)
+        raise HTTPException(status_code=500, detail=str(error))
+    return {"job_id": job_id, "status": "DONE", **future.result()}
 
 @app.post("/simulate-disruption")
 def simulate_disruption():
     """Triggers Phase 5 'Black Swan' logic."""
     try:
         sim = DynamicSimulator()
-        sim.run_m5_scenario()
-        
-        rerouted_plan = []
-        if os.path.exists("output/routes.json"):
-            with open("output/routes.json", 'r') as f:
-                rerouted_plan = json.load(f)
+        # The reroute payload comes back in memory (None if the scenario bailed out)
+        rerouted_plan = sim.run_m5_scenario() or []
                 
         summary = "Simulation complete."
         if os.path.exists("simulation_log.md"):
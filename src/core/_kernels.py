@@ -0,0 +1,127 @@
+"""
+Numba-compiled numeric kernels shared by the routing core.
+
+Compiled on first import and cached to disk (``cache=True``), so the JIT cost
+is paid once per environment rather than once per request.
+"""
+import math
+
+import numpy as np
+from numba import float64, int64, njit, prange, vectorize
+
+EARTH_RADIUS_KM = 6371.0
+
+
+@njit(float64(float64, float64, float64, float64), cache=True, fastmath=True)
+def haversine_scalar(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two points given in degrees."""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = (math.sin(dlat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) *
+         math.sin(dlon / 2) ** 2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+@vectorize([float64(float64, float64, float64, float64)], cache=True, fastmath=True)
+def haversine_ufunc(lat1, lon1, lat2, lon2):
+    """NumPy ufunc form of haversine_scalar; broadcasts over arrays of coordinates."""
+    return haversine_scalar(lat1, lon1, lat2, lon2)
+
+
+@njit(float64[:, :](float64[:], float64[:], int64[:]), parallel=True, fastmath=True, cache=True)
+def build_duration_matrix(lats, lons, tiers):
+    """
+    Haversine + tier-speed duration matrix (minutes), rows filled in parallel.
+    Same rule as calculate_duration_fallback, keyed on the destination tier.
+    """
+    n = lats.shape[0]
+    out = np.empty((n, n))
+    for i in prange(n):
+        for j in range(n):
+            if i == j:
+                out[i, j] = 0.0
+                continue
+            dist_km = haversine_scalar(lats[i], lons[i], lats[j], lons[j])
+            if tiers[j] == 1 or tiers[j] == 2:
+                out[i, j] = dist_km * 1.4 / 50.0 * 60
+            else:
+                out[i, j] = dist_km / 80.0 * 60
+    return out
+
+
+@njit(cache=True, fastmath=True)
+def segment_near_point(olat, olon, dlat_, dlon_, plat, plon, radius_km):
+    """True if any of 11 points sampled along origin -> dest lies within radius_km of (plat, plon)."""
+    for i in range(11):
+        t = i / 10.0
+        lat = olat + (dlat_ - olat) * t
+        lon = olon + (dlon_ - olon) * t
+        if haversine_scalar(lat, lon, plat, plon) < radius_km:
+            return True
+    return False
+
+
+# No fastmath: the +inf padding must survive the isfinite check
+@njit(parallel=True, cache=True)
+def scan_disruptions(arrivals, lat, lon, t_disrupt):
+    """
+    Locates every route's active leg at t_disrupt and interpolates the van position.
+    arrivals/lat/lon are (routes, max_steps), padded with +inf/NaN past each route's end.
+    Returns (leg_idx, frac, van_lat, van_lon) per route; leg_idx is -1 when the van is
+    not between two stops at t_disrupt.
+    """
+    n_routes, n_steps = arrivals.shape
+    leg_idx = np.full(n_routes, -1, dtype=np.int64)
+    frac = np.zeros(n_routes)
+    van_lat = np.full(n_routes, np.nan)
+    van_lon = np.full(n_routes, np.nan)
+    for r in prange(n_routes):
+        i = np.searchsorted(arrivals[r], t_disrupt, side='right') - 1
+        if i < 0 or i >= n_steps - 1 or not np.isfinite(arrivals[r, i + 1]):
+            continue
+        start = arrivals[r, i]
+        duration = arrivals[r, i + 1] - start
+        f = (t_disrupt - start) / duration if duration > 0 else 0.0
+        leg_idx[r] = i
+        frac[r] = f
+        van_lat[r] = lat[r, i] + (lat[r, i + 1] - lat[r, i]) * f
+        van_lon[r] = lon[r, i] + (lon[r, i + 1] - lon[r, i]) * f
+    return leg_idx, frac, van_lat, van_lon
+
+
+@njit(cache=True)
+def decode_polyline(buf):
+    """
+    Decodes a Google encoded polyline (precision 5) from its ASCII bytes.
+    Returns an (N, 2) float64 array of (lat, lon); raises ValueError on truncated input.
+    """
+    n = buf.shape[0]
+    out = np.empty((n // 2 + 1, 2))  # every value takes at least one byte
+    count = 0
+    idx = 0
+    lat = 0
+    lon = 0
+    while idx < n:
+        for k in range(2):
+            result = 0
+            shift = 0
+            while True:
+                if idx >= n:
+                    raise ValueError("truncated polyline")
+                b = np.int64(buf[idx]) - 63
+                idx += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            delta = ~(result >> 1) if result & 1 else result >> 1
+            if k == 0:
+                lat += delta
+            else:
+                lon += delta
+        out[count, 0] = lat / 1e5
+        out[count, 1] = lon / 1e5
+        count += 1
+    return out[:count].copy()
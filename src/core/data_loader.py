@@ -1,9 +1,13 @@
-import json
 import os
+import orjson
 from dataclasses import dataclass
-from typing import List
+from functools import lru_cache
+from typing import List, Tuple
 
-@dataclass
+# Indexed by tier: Source, Metro, Regional, Remote
+_PRIORITY_WEIGHT = (0.0, 3.0, 2.0, 1.0)
+
+@dataclass(slots=True, frozen=True)
 class Hospital:
     name: str
     lat: float
@@ -11,6 +15,11 @@ class Hospital:
     tier: int
     type: str
 
+    def __post_init__(self):
+        # Validated once here so get_priority_weight can be a bare lookup
+        if not 0 <= self.tier < len(_PRIORITY_WEIGHT):
+            raise ValueError(f"Invalid tier: {self.tier}")
+
     def get_priority_weight(self) -> float:
         """
         Returns the priority weight based on the hospital's tier.
@@ -19,16 +28,26 @@ class Hospital:
         Tier 1 (Metro): 3.0
         Tier 0 (Source): 0.0 (Excluded from delivery priority)
         """
-        if self.tier == 3:
-            return 1.0
-        elif self.tier == 2:
-            return 2.0
-        elif self.tier == 1:
-            return 3.0
-        elif self.tier == 0:
-            return 0.0 # Source
-        else:
-            raise ValueError(f"Invalid tier: {self.tier}")
+        return _PRIORITY_WEIGHT[self.tier]
+
+@lru_cache(maxsize=8)
+def _load(abs_path: str, mtime_ns: int) -> Tuple[Hospital, ...]:
+    """Parses the hospital file once per (path, mtime); a rewrite of the file changes the key."""
+    with open(abs_path, 'rb') as f:
+        data = orjson.loads(f.read())
+
+    hospitals = []
+    for entry in data:
+        # Validate required fields could go here
+        hospitals.append(Hospital(
+            name=entry["name"],
+            lat=entry["lat"],
+            lon=entry["lon"],
+            tier=entry["tier"],
+            type=entry["type"]
+        ))
+
+    return tuple(hospitals)
 
 def load_hospitals(file_path: str = "hospitals.json") -> List[Hospital]:
     """
@@ -42,7 +61,7 @@ def load_hospitals(file_path: str = "hospitals.json") -> List[Hospital]:
         
     Raises:
         FileNotFoundError: If the file does not exist.
-        json.JSONDecodeError: If the file is not valid JSON.
+        json.JSONDecodeError: If the file is not valid JSON (orjson.JSONDecodeError subclasses it).
     """
     # Robust path handling
     if not os.path.exists(file_path):
@@ -57,20 +76,8 @@ def load_hospitals(file_path: str = "hospitals.json") -> List[Hospital]:
                  file_path = rel_path
     
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
+        mtime_ns = os.stat(file_path).st_mtime_ns
     except FileNotFoundError:
         raise FileNotFoundError(f"Could not find hospital data file at {file_path}")
 
-    hospitals = []
-    for entry in data:
-        # Validate required fields could go here
-        hospitals.append(Hospital(
-            name=entry["name"],
-            lat=entry["lat"],
-            lon=entry["lon"],
-            tier=entry["tier"],
-            type=entry["type"]
-        ))
-    
-    return hospitals
+    return list(_load(os.path.abspath(file_path), mtime_ns))
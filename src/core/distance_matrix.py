@@ -1,17 +1,62 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
 import time
-import math
+import threading
 import numpy as np
-import polyline
-from typing import List, Tuple, Optional, Dict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Dict
 from dataclasses import dataclass
 from dotenv import load_dotenv
 
+from src.core._kernels import (build_duration_matrix, decode_polyline, haversine_scalar,
+                               haversine_ufunc, segment_near_point)
+
 load_dotenv()
 
 TFNSW_API_TOKEN = os.getenv("TFNSW_API_TOKEN")
 
+# Shared keep-alive session: OSRM/TfNSW calls reuse pooled TCP+TLS connections
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=2))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=2))
+
+
+class RateLimiter:
+    """
+    Sliding-window limiter: at most max_calls entries per period seconds.
+    Blocks only when the window is full, so callers run at the quota rather
+    than a fixed worst-case delay. Thread-safe; use as a context manager.
+    """
+
+    def __init__(self, max_calls: int, period: float = 1.0):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return self
+                time.sleep(self.period - (now - self._calls[0]))
+
+    def __exit__(self, *exc):
+        return False
+
+
+# TfNSW trip planner quota (requests per second)
+_TFNSW_LIMITER = RateLimiter(max_calls=4, period=1.0)
+TFNSW_MAX_WORKERS = 4
+
+
 @dataclass
 class Location:
     lat: float
@@ -38,7 +83,8 @@ class TfNSWClient:
             'calcNumberOfTrips': 1
         }
         try:
-            response = requests.get(url, headers=self.headers, params=params, timeout=10)
+            with _TFNSW_LIMITER:
+                response = _SESSION.get(url, headers=self.headers, params=params, timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 if 'journeys' in data and len(data['journeys']) > 0:
@@ -52,14 +98,12 @@ class TfNSWClient:
 
 
 def get_haversine_distance(origin: Location, destination: Location) -> float:
-    R = 6371
-    dlat = math.radians(destination.lat - origin.lat)
-    dlon = math.radians(destination.lon - origin.lon)
-    a = (math.sin(dlat / 2) ** 2 +
-         math.cos(math.radians(origin.lat)) * math.cos(math.radians(destination.lat)) *
-         math.sin(dlon / 2) ** 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+    return haversine_scalar(origin.lat, origin.lon, destination.lat, destination.lon)
+
+
+def _haversine_row(lat0: float, lon0: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle km from one point to every (lats[i], lons[i]) in a single ufunc pass."""
+    return haversine_ufunc(lat0, lon0, np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
 
 
 def calculate_duration_fallback(distance_km: float, tier: int) -> float:
@@ -70,26 +114,87 @@ def calculate_duration_fallback(distance_km: float, tier: int) -> float:
     return (distance_km * multiplier / speed) * 60
 
 
-def generate_distance_matrix(locations: List[dict], client: Optional[TfNSWClient] = None) -> np.ndarray:
-    n = len(locations)
-    matrix = np.zeros((n, n))
+def calculate_duration_fallback_arr(distance_km: np.ndarray, tiers) -> np.ndarray:
+    """Array form of calculate_duration_fallback; tiers is a scalar or one tier per distance."""
+    urban = np.isin(tiers, [1, 2])
+    return np.asarray(distance_km) * np.where(urban, 1.4, 1.0) / np.where(urban, 50.0, 80.0) * 60
+
+
+def _fallback_duration_matrix(lats: np.ndarray, lons: np.ndarray, tiers: np.ndarray) -> np.ndarray:
+    """Haversine + tier-speed estimate for every (origin, destination) pair."""
+    return build_duration_matrix(np.ascontiguousarray(lats, dtype=np.float64),
+                                 np.ascontiguousarray(lons, dtype=np.float64),
+                                 np.ascontiguousarray(tiers, dtype=np.int64))
+
+
+def generate_distance_matrix_arr(lats: np.ndarray, lons: np.ndarray, tiers: np.ndarray,
+                                 client: Optional[TfNSWClient] = None,
+                                 osrm: bool = False, return_routed: bool = False):
+    """
+    Duration matrix (minutes) from struct-of-arrays coordinates and tiers.
+    Starts from the haversine fallback; with osrm=True, cells OSRM can route are
+    replaced by one /table call, then any TfNSW durations take precedence.
+
+    With return_routed=True returns (matrix, routed), where routed is True only if the
+    OSRM table answered (TfNSW is then just an override) or, without it, TfNSW answered
+    every off-diagonal cell, i.e. no haversine cell is left and the matrix is safe to persist.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+    n = len(lats)
+    matrix = _fallback_duration_matrix(lats, lons, np.asarray(tiers))
+    routed = osrm
+
+    if osrm:
+        table = fetch_osrm_duration_table(lats, lons)
+        if table is not None:
+            # Unreachable pairs come back as null -> NaN; keep the fallback there
+            matrix = np.where(np.isfinite(table), table, matrix)
+            np.fill_diagonal(matrix, 0.0)
+        else:
+            routed = False
+
     use_api = client is not None and client.token is not None
-    for i in range(n):
-        for j in range(n):
-            if i == j:
-                continue
-            origin = Location(locations[i]['lat'], locations[i]['lon'])
-            dest = Location(locations[j]['lat'], locations[j]['lon'])
-            dest_tier = locations[j]['tier']
-            duration = None
-            if use_api:
-                time.sleep(0.25)
-                duration = client.get_trip_duration(origin, dest)
-            if duration is None:
-                dist = get_haversine_distance(origin, dest)
-                duration = calculate_duration_fallback(dist, dest_tier)
-            matrix[i][j] = duration
-    return matrix
+    if use_api:
+        # API durations overwrite the fallback only where TfNSW answered; the client's
+        # rate limiter paces the pooled requests to the TfNSW quota
+        off_diag = ~np.eye(n, dtype=bool)
+        orig, dest = np.nonzero(off_diag)
+        with ThreadPoolExecutor(max_workers=TFNSW_MAX_WORKERS) as pool:
+            durations = pool.map(
+                lambda ij: client.get_trip_duration(Location(lats[ij[0]], lons[ij[0]]),
+                                                    Location(lats[ij[1]], lons[ij[1]])),
+                zip(orig, dest))
+            api = np.full((n, n), np.nan)
+            api[orig, dest] = np.fromiter((np.nan if d is None else d for d in durations),
+                                          dtype=np.float64, count=orig.size)
+        answered = np.isfinite(api)
+        matrix = np.where(answered, api, matrix)
+        routed = routed or bool(answered[off_diag].all())
+
+    return (matrix, routed) if return_routed else matrix
+
+
+def generate_distance_matrix(locations: List[dict], client: Optional[TfNSWClient] = None) -> np.ndarray:
+    return generate_distance_matrix_arr(
+        [l['lat'] for l in locations],
+        [l['lon'] for l in locations],
+        [l['tier'] for l in locations],
+        client)
+
+
+def reroute_duration_matrix(base: np.ndarray, lats: np.ndarray, lons: np.ndarray, tiers: np.ndarray,
+                            idx: np.ndarray, origin_lat: float, origin_lon: float) -> np.ndarray:
+    """
+    Duration matrix over [origin, *idx] for a mid-route reroute. Durations between the
+    remaining stops are sliced from base; only the new origin's row and column (a tier-0
+    van position) are estimated with the haversine fallback.
+    """
+    dist_km = _haversine_row(origin_lat, origin_lon, lats[idx], lons[idx])
+    row0 = calculate_duration_fallback_arr(dist_km, tiers[idx])  # origin -> stop
+    col0 = calculate_duration_fallback_arr(dist_km, 0)           # stop -> origin (tier 0)
+    return np.block([[np.zeros((1, 1)), row0[None, :]],
+                     [col0[:, None], base[np.ix_(idx, idx)]]])
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -100,7 +205,7 @@ def snap_to_road(lat: float, lon: float) -> Dict:
     """Uses OSRM nearest service to snap a coordinate to the road network."""
     try:
         url = f"http://router.project-osrm.org/nearest/v1/driving/{lon},{lat}"
-        r = requests.get(url, params={'number': 1}, timeout=5)
+        r = _SESSION.get(url, params={'number': 1}, timeout=5)
         if r.status_code == 200:
             data = r.json()
             if data['code'] == 'Ok' and data.get('waypoints'):
@@ -116,79 +221,129 @@ def snap_to_road(lat: float, lon: float) -> Dict:
     return {'lat': lat, 'lon': lon, 'distance_m': 0, 'name': ''}
 
 
+def fetch_osrm_duration_table(lats: np.ndarray, lons: np.ndarray) -> Optional[np.ndarray]:
+    """Uses the OSRM table service to fetch the full NxN duration matrix (minutes) in one request."""
+    try:
+        coords = ";".join(f"{lon},{lat}" for lat, lon in zip(lats, lons))
+        url = f"http://router.project-osrm.org/table/v1/driving/{coords}"
+        r = _SESSION.get(url, params={'annotations': 'duration'}, timeout=10)
+        if r.status_code == 200:
+            data = r.json()
+            if data['code'] == 'Ok' and data.get('durations'):
+                return np.array(data['durations'], dtype=float) / 60.0
+    except Exception as e:
+        print(f"OSRM table failed: {e}")
+    return None
+
+
 def _is_segment_near_point(origin: Location, dest: Location,
                             point_lat: float, point_lon: float,
                             radius_km: float = 2.0) -> bool:
-    for i in range(11):
-        t = i / 10.0
-        lat = origin.lat + (dest.lat - origin.lat) * t
-        lon = origin.lon + (dest.lon - origin.lon) * t
-        if get_haversine_distance(Location(lat, lon), Location(point_lat, point_lon)) < radius_km:
-            return True
-    return False
+    return segment_near_point(origin.lat, origin.lon, dest.lat, dest.lon,
+                              point_lat, point_lon, radius_km)
+
+
+def detour_waypoints(olats, olons, dlats, dlons, avoid_lat: float, avoid_lon: float):
+    """
+    Detour waypoints for a batch of (origin, dest) arcs around one avoid point.
+    Offsets ~5km perpendicular to each arc, on whichever side is closer to the arc midpoint.
+    Returns (wp_lats, wp_lons) arrays.
+    """
+    olats, olons = np.asarray(olats, dtype=float), np.asarray(olons, dtype=float)
+    dlats, dlons = np.asarray(dlats, dtype=float), np.asarray(dlons, dtype=float)
+    px = -(dlons - olons)
+    py = dlats - olats
+    mag = np.sqrt(px * px + py * py)
+    degenerate = mag == 0
+    safe_mag = np.where(degenerate, 1.0, mag)
+    px = px / safe_mag
+    py = py / safe_mag
+
+    offset = 0.045  # ~5km
+    wp1_lat, wp1_lon = avoid_lat + px * offset, avoid_lon + py * offset
+    wp2_lat, wp2_lon = avoid_lat - px * offset, avoid_lon - py * offset
+    mid_lat, mid_lon = (olats + dlats) / 2, (olons + dlons) / 2
+    d1 = haversine_ufunc(wp1_lat, wp1_lon, mid_lat, mid_lon)
+    d2 = haversine_ufunc(wp2_lat, wp2_lon, mid_lat, mid_lon)
+    wp_lat = np.where(d1 < d2, wp2_lat, wp1_lat)
+    wp_lon = np.where(d1 < d2, wp2_lon, wp1_lon)
+
+    # Zero-length arcs have no perpendicular: step north of the avoid point instead
+    wp_lat = np.where(degenerate, avoid_lat + 0.04, wp_lat)
+    wp_lon = np.where(degenerate, avoid_lon, wp_lon)
+    return wp_lat, wp_lon
 
 
 def _calculate_detour_waypoint(origin: Location, dest: Location,
                                 avoid_lat: float, avoid_lon: float) -> Location:
-    dx = dest.lat - origin.lat
-    dy = dest.lon - origin.lon
-    px, py = -dy, dx
-    mag = math.sqrt(px * px + py * py)
-    if mag == 0:
-        return Location(avoid_lat + 0.04, avoid_lon)
-    px /= mag
-    py /= mag
-    offset = 0.045  # ~5km
-    wp1 = Location(avoid_lat + px * offset, avoid_lon + py * offset)
-    wp2 = Location(avoid_lat - px * offset, avoid_lon - py * offset)
-    mid = Location((origin.lat + dest.lat) / 2, (origin.lon + dest.lon) / 2)
-    d1 = get_haversine_distance(wp1, mid)
-    d2 = get_haversine_distance(wp2, mid)
-    return wp2 if d1 < d2 else wp1
+    wp_lat, wp_lon = detour_waypoints([origin.lat], [origin.lon], [dest.lat], [dest.lon],
+                                      avoid_lat, avoid_lon)
+    return Location(float(wp_lat[0]), float(wp_lon[0]))
+
+
+@lru_cache(maxsize=4096)
+def _fetch_osrm_route_cached(olat: float, olon: float, dlat: float, dlon: float,
+                             wp_lat: Optional[float], wp_lon: Optional[float]) -> Dict:
+    """
+    Memoised OSRM route request on quantised, hashable arguments; wp_lat/wp_lon
+    is the detour waypoint, or None for the direct route.
+    Raises on any failure so that only successful responses are cached.
+    """
+    use_detour = wp_lat is not None
+    if use_detour:
+        coords = f"{olon},{olat};{wp_lon},{wp_lat};{dlon},{dlat}"
+        radiuses = "unlimited;50;unlimited"  # 50m snap radius for detour waypoint
+    else:
+        coords = f"{olon},{olat};{dlon},{dlat}"
+        radiuses = None
+
+    url = f"http://router.project-osrm.org/route/v1/driving/{coords}"
+    params = {'overview': 'full', 'geometries': 'polyline'}
+    if radiuses:
+        params['radiuses'] = radiuses
+
+    response = _SESSION.get(url, params=params, timeout=10)
+    if response.status_code != 200:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    data = response.json()
+    if data['code'] != 'Ok' or not data['routes']:
+        raise RuntimeError(f"OSRM code {data['code']}")
+
+    route = data['routes'][0]
+    geometry = decode_polyline(np.frombuffer(route['geometry'].encode('ascii'), dtype=np.uint8))
+    geometry.setflags(write=False)  # shared by every cache hit
+    return {
+        'duration_min': route['duration'] / 60.0,
+        'distance_km': route['distance'] / 1000.0,
+        'geometry': geometry,
+        'detoured': use_detour
+    }
 
 
 def fetch_osrm_route_data(origin: Location, dest: Location,
-                           avoid_point: Optional[Dict[str, float]] = None) -> Dict:
+                           avoid_point: Optional[Dict[str, float]] = None,
+                           detour_wp: Optional[Location] = None) -> Dict:
     """
-    Core OSRM function: returns duration (minutes) AND geometry.
-    If avoid_point is set and the route passes near it, injects a detour waypoint.
+    Core OSRM function: returns duration (minutes) AND geometry as an (N, 2) lat/lon array.
+    If avoid_point is set and the route passes near it, injects a detour waypoint;
+    callers that already batch-computed the waypoint can pass it as detour_wp.
     This is the single source of truth for both matrix building and geometry fetching.
+    Endpoints and waypoint are quantised to 5 decimals (~1m) and the avoid point to 4,
+    so repeat requests for the same segment are served from the in-process cache.
     """
     try:
-        use_detour = False
-        detour_wp = None
-
-        if avoid_point:
-            if _is_segment_near_point(origin, dest, avoid_point['lat'], avoid_point['lon']):
-                use_detour = True
-                detour_wp = _calculate_detour_waypoint(
-                    origin, dest, avoid_point['lat'], avoid_point['lon'])
-
-        if use_detour and detour_wp:
-            coords = (f"{origin.lon},{origin.lat};"
-                      f"{detour_wp.lon},{detour_wp.lat};"
-                      f"{dest.lon},{dest.lat}")
-            radiuses = "unlimited;50;unlimited"  # 50m snap radius for detour waypoint
-        else:
-            coords = f"{origin.lon},{origin.lat};{dest.lon},{dest.lat}"
-            radiuses = None
-
-        url = f"http://router.project-osrm.org/route/v1/driving/{coords}"
-        params = {'overview': 'full', 'geometries': 'polyline'}
-        if radiuses:
-            params['radiuses'] = radiuses
-
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            if data['code'] == 'Ok' and data['routes']:
-                route = data['routes'][0]
-                return {
-                    'duration_min': route['duration'] / 60.0,
-                    'distance_km': route['distance'] / 1000.0,
-                    'geometry': polyline.decode(route['geometry']),
-                    'detoured': use_detour
-                }
+        if detour_wp is None and avoid_point:
+            av_lat = round(float(avoid_point['lat']), 4)
+            av_lon = round(float(avoid_point['lon']), 4)
+            if _is_segment_near_point(origin, dest, av_lat, av_lon):
+                detour_wp = _calculate_detour_waypoint(origin, dest, av_lat, av_lon)
+
+        wp_lat = round(float(detour_wp.lat), 5) if detour_wp else None
+        wp_lon = round(float(detour_wp.lon), 5) if detour_wp else None
+        return dict(_fetch_osrm_route_cached(
+            round(float(origin.lat), 5), round(float(origin.lon), 5),
+            round(float(dest.lat), 5), round(float(dest.lon), 5),
+            wp_lat, wp_lon))
     except Exception as e:
         print(f"OSRM route data failed ({origin.lat:.3f},{origin.lon:.3f} -> "
               f"{dest.lat:.3f},{dest.lon:.3f}): {e}")
@@ -197,7 +352,7 @@ def fetch_osrm_route_data(origin: Location, dest: Location,
     dist = get_haversine_distance(origin, dest)
     return {
         'duration_min': calculate_duration_fallback(dist, 1),
-        'geometry': [(origin.lat, origin.lon), (dest.lat, dest.lon)],
+        'geometry': np.array([[origin.lat, origin.lon], [dest.lat, dest.lon]], dtype=float),
         'distance_km': dist,
         'detoured': False
     }
@@ -205,6 +360,6 @@ def fetch_osrm_route_data(origin: Location, dest: Location,
 
 def fetch_route_geometry(origin: Location, dest: Location,
                          avoid_point: Optional[Dict[str, float]] = None
-                         ) -> List[Tuple[float, float]]:
+                         ) -> np.ndarray:
     """Convenience wrapper — returns only the geometry."""
     return fetch_osrm_route_data(origin, dest, avoid_point)['geometry']
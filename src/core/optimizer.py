@@ -1,14 +1,22 @@
-import json
+import hashlib
 import math
 import os
+import sqlite3
+import tempfile
+import threading
+import numpy as np
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import List, Dict, Optional
 from ortools.constraint_solver import routing_enums_pb2, pywrapcp
 
 from src.core.data_loader import load_hospitals, Hospital
+from src.core._kernels import haversine_ufunc, segment_near_point
 from src.core.distance_matrix import (
-    generate_distance_matrix, TfNSWClient, Location,
-    fetch_osrm_route_data, snap_to_road,
-    get_haversine_distance
+    generate_distance_matrix_arr, TfNSWClient, Location,
+    fetch_osrm_route_data, snap_to_road, detour_waypoints
 )
 from src.core.use_cases.decay_calculator import DecayCalculator
 
@@ -23,21 +31,132 @@ FUTILITY_THRESHOLD = 35.0
 # ── Financial Constants ──
 DOSE_VALUE_AUD = 1500  # Base manufacturing + logistics cost per Tc-99m dose
 
+# ── OSRM Concurrency ──
+OSRM_MAX_WORKERS = 16  # Parallel HTTP requests; wall time ~ max(RTT) instead of sum(RTT)
+
+# ── On-Disk Caches ──
+# Default directory for the baseline matrix and detour caches; NM_CACHE_DIR overrides it
+CACHE_DIR = os.getenv("NM_CACHE_DIR", "output")
+DETOUR_CACHE_NAME = "detour_cache.sqlite"
+
+
+def _hospitals_cache_key(lats, lons, tiers, *extra) -> str:
+    """Stable digest of the ordered coordinate/tier arrays; order matters since matrix cells are indexed by it."""
+    digest = hashlib.blake2b(digest_size=16)
+    for arr in (lats, lons, tiers):
+        digest.update(np.ascontiguousarray(arr).tobytes())
+    digest.update(repr(extra).encode())
+    return digest.hexdigest()
+
+
+def _save_npy_atomic(path: str, arr: np.ndarray) -> None:
+    """Write to a sibling temp file and rename over `path`, so readers never load a half-written matrix."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path) or ".", suffix=".npy", delete=False) as f:
+        np.save(f, arr)
+    os.replace(f.name, path)
+
+
+def _open_detour_cache(path: str) -> sqlite3.Connection:
+    """SQLite does its own file locking, so parallel optimizer processes can share the store."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS detours "
+                 "(key TEXT PRIMARY KEY, duration REAL NOT NULL, detoured INTEGER NOT NULL)")
+    return conn
+
+
+def _load_detours(path: str, keys: List[str]) -> Dict[str, tuple]:
+    conn = _open_detour_cache(path)
+    try:
+        found = {}
+        for start in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+            chunk = keys[start:start + 500]
+            rows = conn.execute(f"SELECT key, duration, detoured FROM detours "
+                                f"WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            found.update((k, (dur, bool(det))) for k, dur, det in rows)
+        return found
+    finally:
+        conn.close()
+
+
+def _store_detours(path: str, entries: Dict[str, tuple]) -> None:
+    if not entries:
+        return
+    conn = _open_detour_cache(path)
+    try:
+        with conn:  # single transaction
+            conn.executemany("INSERT OR REPLACE INTO detours VALUES (?, ?, ?)",
+                             [(k, float(dur), int(det)) for k, (dur, det) in entries.items()])
+    finally:
+        conn.close()
+
+
+@dataclass
+class _RoutingSkeleton:
+    manager: pywrapcp.RoutingIndexManager
+    routing: pywrapcp.RoutingModel
+    node_of: np.ndarray   # solver index -> node
+    time_mat: np.ndarray  # solver-index space, overwritten in place before each solve
+    cost_mat: np.ndarray
+    callbacks: tuple      # keeps the Python callables alive for the C++ model
+    # lru_cache shares one skeleton per process; held across fill + solve + export
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def attach_route_columns(routes: List[Dict]) -> List[Dict]:
+    """
+    Stamps columnar copies of each exported route's steps onto the route dict:
+    '_arr' (arrival minutes), '_names' and '_tier'. Routes that already carry them are skipped.
+    """
+    for route in routes:
+        if '_arr' in route:
+            continue
+        steps = route['steps']
+        route['_arr'] = np.fromiter((st['arrival_time_min'] for st in steps), dtype=np.float64, count=len(steps))
+        route['_names'] = [st['name'] for st in steps]
+        route['_tier'] = np.fromiter((st['tier'] for st in steps), dtype=np.int8, count=len(steps))
+    return routes
+
 
 class IsotopeOptimizer:
-    def __init__(self, hospitals_file="hospitals.json", hospitals_list=None, custom_matrix=None):
+    def __init__(self, hospitals_file="hospitals.json", hospitals_list=None, custom_matrix=None,
+                 cache_dir=None):
         self.hospitals = hospitals_list if hospitals_list else load_hospitals(hospitals_file)
         self.depot_index = 0
         self.avoid_point = None
         self.snapped_incident = None
 
+        # Struct-of-arrays view of the hospitals for the vectorised kernels
+        n = len(self.hospitals)
+        self.lats = np.fromiter((h.lat for h in self.hospitals), dtype=float, count=n)
+        self.lons = np.fromiter((h.lon for h in self.hospitals), dtype=float, count=n)
+        self.tiers = np.fromiter((h.tier for h in self.hospitals), dtype=np.int64, count=n)
+        self.names = np.array([h.name for h in self.hospitals])
+
+        self.cache_key = _hospitals_cache_key(self.lats, self.lons, self.tiers)
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.detour_cache_path = os.path.join(self.cache_dir, DETOUR_CACHE_NAME)
+
+        self.fixed_matrix = custom_matrix is not None
         if custom_matrix is not None:
             self.distance_matrix = custom_matrix
         else:
             client = TfNSWClient() if os.getenv("TFNSW_API_TOKEN") else None
-            loc_dicts = [{"lat": h.lat, "lon": h.lon, "tier": h.tier} for h in self.hospitals]
-            print("Generating distance matrix...")
-            self.distance_matrix = generate_distance_matrix(loc_dicts, client)
+            # Baseline matrix only depends on coordinates, tiers and data source, so editing
+            # names or re-saving hospitals.json still hits the cache
+            matrix_key = _hospitals_cache_key(self.lats, self.lons, self.tiers, client is not None, "osrm")
+            matrix_path = os.path.join(self.cache_dir, f"matrix_cache_{matrix_key}.npy")
+            if os.path.exists(matrix_path):
+                print("Loading cached distance matrix...")
+                self.distance_matrix = np.load(matrix_path)
+            else:
+                print("Generating distance matrix...")
+                self.distance_matrix, routed = generate_distance_matrix_arr(
+                    self.lats, self.lons, self.tiers, client, osrm=True, return_routed=True)
+                # Never persist a pure haversine fallback (OSRM/TfNSW down); retry next run
+                if routed:
+                    _save_npy_atomic(matrix_path, self.distance_matrix)
 
         self.num_vehicles = 4
         self.vehicle_capacity = 10
@@ -52,13 +171,7 @@ class IsotopeOptimizer:
         return data
 
     def is_segment_impacted(self, loc1, loc2, lat, lon, radius_km=2.0):
-        for i in range(11):
-            t = i / 10.0
-            plat = loc1.lat + (loc2.lat - loc1.lat) * t
-            plon = loc1.lon + (loc2.lon - loc1.lon) * t
-            if get_haversine_distance(Location(plat, plon), Location(lat, lon)) < radius_km:
-                return True
-        return False
+        return segment_near_point(loc1.lat, loc1.lon, loc2.lat, loc2.lon, lat, lon, radius_km)
 
     # ═══════════════════════════════════════════════════════════════
     #  TASK 1: FORCED ROAD DIVERSION (Real OSRM Detour Durations)
@@ -69,42 +182,64 @@ class IsotopeOptimizer:
         query OSRM for the ACTUAL detour duration around the closure.
         The solver then works with realistic travel times and finds genuine alternative sequences.
         """
-        incident_loc = Location(avoid_point['lat'], avoid_point['lon'])
-        n = len(self.hospitals)
+        a_lat, a_lon = avoid_point['lat'], avoid_point['lon']
         rerouted = 0
         checked = 0
 
-        for i in range(n):
-            for j in range(n):
-                if i == j:
-                    continue
+        # ── Screen every arc at once ──
+        lats, lons = self.lats, self.lons
+
+        # Quick pre-filter: skip arcs where both endpoints are >50km from incident
+        d_incident = haversine_ufunc(lats, lons, a_lat, a_lon)
+        near_endpoint = (d_incident[:, None] <= 50) | (d_incident[None, :] <= 50)
+
+        # Sample 11 interpolated points along all n² arcs: shape (n, n, 11)
+        t = np.linspace(0.0, 1.0, 11)
+        lat_samples = lats[:, None, None] + (lats[None, :, None] - lats[:, None, None]) * t
+        lon_samples = lons[:, None, None] + (lons[None, :, None] - lons[:, None, None]) * t
+        passes_incident = (haversine_ufunc(lat_samples, lon_samples, a_lat, a_lon) < 2.0).any(axis=-1)
+
+        impact_mask = near_endpoint & passes_incident
+        np.fill_diagonal(impact_mask, False)
 
-                loc1 = Location(self.hospitals[i].lat, self.hospitals[i].lon)
-                loc2 = Location(self.hospitals[j].lat, self.hospitals[j].lon)
+        # ── Reuse detour durations already fetched for this hospital set + incident ──
+        arcs = [(int(i), int(j)) for i, j in np.argwhere(impact_mask)]
+        keys = [f"{self.cache_key}:{i},{j},{round(a_lat, 4)},{round(a_lon, 4)}" for i, j in arcs]
+        cached = _load_detours(self.detour_cache_path, keys)
 
-                # Quick pre-filter: skip if both endpoints are >50km from incident
-                d1 = get_haversine_distance(loc1, incident_loc)
-                d2 = get_haversine_distance(loc2, incident_loc)
-                if d1 > 50 and d2 > 50:
-                    continue
+        pending = [((i, j), k) for (i, j), k in zip(arcs, keys) if k not in cached]
+        oi = np.array([i for (i, _), _ in pending], dtype=int)
+        di = np.array([j for (_, j), _ in pending], dtype=int)
+        wp_lats, wp_lons = detour_waypoints(lats[oi], lons[oi], lats[di], lons[di], a_lat, a_lon)
 
-                if self.is_segment_impacted(loc1, loc2, avoid_point['lat'], avoid_point['lon']):
-                    checked += 1
-                    # Get REAL alternative route duration from OSRM
-                    route_data = fetch_osrm_route_data(loc1, loc2, avoid_point)
-                    original = self.distance_matrix[i][j]
-                    osrm_dur = route_data['duration_min']
+        tasks = [(k, Location(lats[i], lons[i]), Location(lats[j], lons[j]), Location(wp_lat, wp_lon))
+                 for ((i, j), k), wp_lat, wp_lon in zip(pending, wp_lats, wp_lons)]
 
-                    # Use the longer of original vs detour to guarantee the impact is visible
-                    # (prevents OSRM returning a shorter path than the haversine estimate)
-                    self.distance_matrix[i][j] = max(original, osrm_dur)
+        # Get REAL alternative route durations from OSRM, all uncached arcs concurrently
+        with ThreadPoolExecutor(max_workers=OSRM_MAX_WORKERS) as ex:
+            fetched = list(ex.map(
+                lambda t: (t[0], fetch_osrm_route_data(t[1], t[2], detour_wp=t[3])), tasks))
 
-                    if route_data['detoured']:
-                        rerouted += 1
+        # Only persist genuine OSRM detours, never the haversine fallback of a failed request
+        for k, route_data in fetched:
+            cached[k] = (route_data['duration_min'], route_data['detoured'])
+        _store_detours(self.detour_cache_path, {k: cached[k] for k, rd in fetched if rd['detoured']})
+
+        for (i, j), k in zip(arcs, keys):
+            checked += 1
+            original = self.distance_matrix[i][j]
+            osrm_dur, detoured = cached[k]
+
+            # Use the longer of original vs detour to guarantee the impact is visible
+            # (prevents OSRM returning a shorter path than the haversine estimate)
+            self.distance_matrix[i][j] = max(original, osrm_dur)
+
+            if detoured:
+                rerouted += 1
 
         print(f"  Checked {checked} arcs, rerouted {rerouted} with OSRM detour durations")
 
-    def solve_and_report(self, avoid_point=None):
+    def solve_and_report(self, avoid_point=None, write=True):
         self.avoid_point = avoid_point
 
         if avoid_point:
@@ -121,47 +256,103 @@ class IsotopeOptimizer:
 
         data = self.create_data_model()
 
-        manager = pywrapcp.RoutingIndexManager(
-            len(data['time_matrix']), data['num_vehicles'], data['depot'])
-        routing = pywrapcp.RoutingModel(manager)
+        # ── Arc matrices for this request (node space) ──
+        time_matrix = np.ascontiguousarray(data['time_matrix'], dtype=float)
+        time_nodes, cost_nodes = IsotopeOptimizer._arc_matrices(time_matrix, self.hospitals)
+
+        # A caller-supplied matrix is fixed for the model's lifetime, so its arcs can be
+        # frozen into OR-Tools' callback cache; the shared baseline skeleton stays uncached
+        arcs_key = time_matrix.tobytes() if self.fixed_matrix else None
+        model = IsotopeOptimizer._build_model(
+            tuple(self.hospitals), data['num_vehicles'], self.vehicle_capacity, data['depot'], arcs_key)
+        # Only the solve and the route walk touch the shared skeleton; export and the
+        # OSRM geometry fetch run after the lock is released
+        with model.lock:
+            solution = IsotopeOptimizer._solve(model, time_nodes, cost_nodes)
+            vehicle_routes = (IsotopeOptimizer._walk_routes(model.manager, model.routing, solution,
+                                                            data['num_vehicles']) if solution else None)
+        if vehicle_routes is not None:
+            return self._export_solution(vehicle_routes, data, write)
+        print("No solution found!")
+        return None
+
+    @staticmethod
+    def _arc_matrices(time_matrix, hospitals):
+        """Integer transit and priority-weighted cost matrices (node space) from minutes."""
+        pw = np.array([1.0 if h.tier == 0 else h.get_priority_weight() for h in hospitals])
+        time_nodes = time_matrix.astype(np.int64)
+        cost_nodes = (time_matrix * (1.0 / pw)[None, :] * 100).astype(np.int64)
+        return time_nodes, cost_nodes
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _build_model(hospitals, num_vehicles, vehicle_capacity, depot, arcs_key=None):
+        """
+        Builds the RoutingModel skeleton (dimensions, bounds, disjunctions) once per
+        hospital set and fleet shape. Callbacks read the model's own index-space
+        matrices, which _solve overwrites in place, so an incident that only changes
+        arc durations reuses the whole C++ model.
+
+        With arcs_key (the bytes of a fixed time matrix) the model is specific to that
+        matrix and OR-Tools caches every callback value as the callback is registered;
+        cached values never see later in-place updates, hence the key.
+        """
+        n = len(hospitals)
+        manager = pywrapcp.RoutingIndexManager(n, num_vehicles, depot)
+        if arcs_key is None:
+            routing = pywrapcp.RoutingModel(manager)
+        else:
+            model_params = pywrapcp.DefaultRoutingModelParameters()
+            model_params.max_callback_cache_size = (n + 2 * num_vehicles) ** 2  # every solver-index pair
+            routing = pywrapcp.RoutingModel(manager, model_params)
+
+        # ── Solver-index lookup tables ──
+        # Arc matrices are re-indexed from node space to solver-index space
+        # (vehicle start/end copies of the depot included), so each callback is a
+        # single C-contiguous int64 gather with no IndexToNode round-trips.
+        node_of = np.array([manager.IndexToNode(i)
+                            for i in range(routing.Size() + routing.vehicles())])
+        size = len(node_of)
+        time_mat = np.zeros((size, size), dtype=np.int64)
+        cost_mat = np.zeros((size, size), dtype=np.int64)
+        demands_arr = np.array([0 if h.tier == 0 else 1 for h in hospitals], dtype=np.int64)[node_of]
+        if arcs_key is not None:
+            # The callback cache is filled as callbacks are registered, so the fixed arcs go in first
+            time_nodes, cost_nodes = IsotopeOptimizer._arc_matrices(
+                np.frombuffer(arcs_key).reshape(n, n), hospitals)
+            IsotopeOptimizer._fill_arcs(node_of, time_mat, cost_mat, time_nodes, cost_nodes)
 
         # ── Transit Callback ──
         def time_callback(from_index, to_index):
-            return int(data['time_matrix'][manager.IndexToNode(from_index)]
-                       [manager.IndexToNode(to_index)])
+            return int(time_mat[from_index, to_index])
 
         transit_cb = routing.RegisterTransitCallback(time_callback)
 
         # ── Cost Callback (priority-weighted) ──
         def cost_callback(from_index, to_index):
-            fn = manager.IndexToNode(from_index)
-            tn = manager.IndexToNode(to_index)
-            tt = data['time_matrix'][fn][tn]
-            dest = self.hospitals[tn]
-            pw = 1.0 if dest.tier == 0 else dest.get_priority_weight()
-            return int(tt * (1.0 / pw) * 100)
+            return int(cost_mat[from_index, to_index])
 
         cost_cb = routing.RegisterTransitCallback(cost_callback)
         routing.SetArcCostEvaluatorOfAllVehicles(cost_cb)
 
         # ── Capacity ──
         def demand_callback(from_index):
-            return data['demands'][manager.IndexToNode(from_index)]
+            return int(demands_arr[from_index])
 
         demand_cb = routing.RegisterUnaryTransitCallback(demand_callback)
         routing.AddDimensionWithVehicleCapacity(
-            demand_cb, 0, data['vehicle_capacities'], True, 'Capacity')
+            demand_cb, 0, [vehicle_capacity] * num_vehicles, True, 'Capacity')
 
         # ── Time Dimension ──
         routing.AddDimension(transit_cb, 30, 1440, True, 'Time')
         time_dim = routing.GetDimensionOrDie('Time')
 
-        for idx, h in enumerate(self.hospitals):
+        for idx, h in enumerate(hospitals):
             if h.tier != 0:
                 time_dim.CumulVar(manager.NodeToIndex(idx)).SetRange(0, 720)
 
         # ── Cardiac-Priority Soft Bounds ──
-        for idx, h in enumerate(self.hospitals):
+        for idx, h in enumerate(hospitals):
             if h.tier == 0:
                 continue
             ni = manager.NodeToIndex(idx)
@@ -173,68 +364,80 @@ class IsotopeOptimizer:
                 time_dim.SetCumulVarSoftUpperBound(ni, 240, 50)
 
         # ── Drop Penalties ──
-        for idx, h in enumerate(self.hospitals):
-            if idx == self.depot_index:
+        for idx, h in enumerate(hospitals):
+            if idx == depot:
                 continue
             penalty = {1: 50000, 2: 200000, 3: 1000000}.get(h.tier, 0)
             routing.AddDisjunction([manager.NodeToIndex(idx)], penalty)
 
+        return _RoutingSkeleton(manager, routing, node_of, time_mat, cost_mat,
+                                (time_callback, cost_callback, demand_callback))
+
+    @staticmethod
+    def _fill_arcs(node_of, time_mat, cost_mat, time_nodes, cost_nodes):
+        """Gathers node-space arc matrices into the model's solver-index-space arrays, in place."""
+        ix = np.ix_(node_of, node_of)
+        np.copyto(time_mat, time_nodes[ix])
+        np.copyto(cost_mat, cost_nodes[ix])
+
+    @staticmethod
+    def _solve(model, time_nodes, cost_nodes):
+        """Swaps this request's arc values into the cached model and runs a fresh search."""
+        IsotopeOptimizer._fill_arcs(model.node_of, model.time_mat, model.cost_mat, time_nodes, cost_nodes)
+
         # ── Solve ──
         params = pywrapcp.DefaultRoutingSearchParameters()
         params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
         params.time_limit.seconds = 10
 
-        solution = routing.SolveWithParameters(params)
-        if solution:
-            self._export_solution(manager, routing, solution, data)
-        else:
-            print("No solution found!")
+        return model.routing.SolveWithParameters(params)
 
     # ═══════════════════════════════════════════════════════════════
     #  EXPORT: Recalculate ETA/Potency, Auto-Cancel, Financial Data
     # ═══════════════════════════════════════════════════════════════
-    def _export_solution(self, manager, routing, solution, data):
-        output_data = []
+    @staticmethod
+    def _walk_routes(manager, routing, solution, num_vehicles):
+        """Copies each vehicle's (nodes, arrivals, end node, end arrival) out of the solver."""
         time_dim = routing.GetDimensionOrDie('Time')
+        vehicle_routes = []
+        for vid in range(num_vehicles):
+            index = routing.Start(vid)
+            nodes, arrivals = [], []
+            while not routing.IsEnd(index):
+                nodes.append(manager.IndexToNode(index))
+                arrivals.append(solution.Min(time_dim.CumulVar(index)))
+                index = solution.Value(routing.NextVar(index))
+            vehicle_routes.append((nodes, arrivals, manager.IndexToNode(index),
+                                   solution.Min(time_dim.CumulVar(index))))
+        return vehicle_routes
+
+    def _export_solution(self, vehicle_routes, data, write=True):
+        output_data = []
 
         fleet_total_potency = 0.0
         fleet_served = 0
         all_canceled = []
 
-        for vid in range(data['num_vehicles']):
-            index = routing.Start(vid)
-            all_steps = []
-
-            # ── Build ALL steps from solver ──
-            while not routing.IsEnd(index):
-                ni = manager.IndexToNode(index)
-                h = self.hospitals[ni]
-                arr_min = solution.Min(time_dim.CumulVar(index))
-                hrs = arr_min / 60.0
-                potency = INITIAL_ACTIVITY * math.exp(-LAMBDA * hrs)
-
-                if potency >= 70:
-                    triage = "OPTIMAL"
-                elif potency >= FUTILITY_THRESHOLD:
-                    triage = "DEGRADED"
-                else:
-                    triage = "FUTILE"
-
-                all_steps.append({
-                    "name": h.name, "tier": h.tier,
-                    "arrival_time_min": arr_min,
-                    "lat": h.lat, "lon": h.lon,
-                    "potency": round(potency, 1),
-                    "triage": triage
-                })
-                index = solution.Value(routing.NextVar(index))
+        for vid, (nodes, arrivals, end_node, end_arrival) in enumerate(vehicle_routes):
+            # ── Potency + triage for every stop in one vectorised pass ──
+            arr = np.asarray(arrivals, dtype=float)
+            potency = INITIAL_ACTIVITY * np.exp(-LAMBDA * arr / 60.0)
+            triage = np.select([potency >= 70, potency >= FUTILITY_THRESHOLD],
+                               ["OPTIMAL", "DEGRADED"], "FUTILE")
+
+            all_steps = [{
+                "name": self.hospitals[ni].name, "tier": self.hospitals[ni].tier,
+                "arrival_time_min": arr_min,
+                "lat": self.hospitals[ni].lat, "lon": self.hospitals[ni].lon,
+                "potency": round(float(pot), 1),
+                "triage": str(tri)
+            } for ni, arr_min, pot, tri in zip(nodes, arrivals, potency, triage)]
 
             # End node (depot return)
-            ni = manager.IndexToNode(index)
-            h = self.hospitals[ni]
+            h = self.hospitals[end_node]
             all_steps.append({
                 "name": h.name, "tier": h.tier,
-                "arrival_time_min": solution.Min(time_dim.CumulVar(index)),
+                "arrival_time_min": end_arrival,
                 "lat": h.lat, "lon": h.lon,
                 "potency": 100.0, "triage": "DEPOT"
             })
@@ -252,34 +455,23 @@ class IsotopeOptimizer:
                         fleet_total_potency += step['potency']
                         fleet_served += 1
 
-            # ── Fetch geometry for viable path (skipping canceled stops) ──
-            geom = []
-            if len(viable) > 1:
-                for i in range(len(viable) - 1):
-                    o = Location(viable[i]['lat'], viable[i]['lon'])
-                    d = Location(viable[i + 1]['lat'], viable[i + 1]['lon'])
-                    seg = fetch_osrm_route_data(o, d, avoid_point=self.avoid_point)['geometry']
-                    if geom and seg and geom[-1] == seg[0]:
-                        geom.extend(seg[1:])
-                    else:
-                        geom.extend(seg)
-
             # ── Per-Van Financial Calculations ──
             van_stops = [s for s in viable if s['tier'] != 0]
-            van_preserved = sum((s['potency'] / 100.0) * DOSE_VALUE_AUD for s in van_stops)
-            van_waste = sum(((100 - s['potency']) / 100.0) * DOSE_VALUE_AUD for s in van_stops)
+            van_pot = np.fromiter((s['potency'] for s in van_stops), dtype=float, count=len(van_stops))
+            van_preserved = float((van_pot / 100.0 * DOSE_VALUE_AUD).sum())
+            van_waste = float(((100 - van_pot) / 100.0 * DOSE_VALUE_AUD).sum())
             # Canceled deliveries = 100% waste
             canceled_waste = len(canceled) * DOSE_VALUE_AUD
             van_waste += canceled_waste
             van_mission = (len(van_stops) + len(canceled)) * DOSE_VALUE_AUD
 
-            avg_pot = sum(s['potency'] for s in van_stops) / len(van_stops) if van_stops else 0
+            avg_pot = float(van_pot.mean()) if van_stops else 0
 
             output_data.append({
                 "vehicle_id": vid,
                 "steps": viable,
                 "canceled": canceled,
-                "geometry": geom,
+                "geometry": [],
                 "avg_potency": round(avg_pot, 1),
                 "financial": {
                     "mission_value": round(van_mission, 0),
@@ -288,6 +480,30 @@ class IsotopeOptimizer:
                 }
             })
 
+        # ── Fetch geometry for viable paths (skipping canceled stops), all vans in one batch ──
+        segments = [(vi, Location(a['lat'], a['lon']), Location(b['lat'], b['lon']))
+                    for vi, r in enumerate(output_data)
+                    for a, b in zip(r['steps'], r['steps'][1:])]
+        with ThreadPoolExecutor(max_workers=OSRM_MAX_WORKERS) as ex:
+            seg_geoms = list(ex.map(
+                lambda t: fetch_osrm_route_data(t[1], t[2], avoid_point=self.avoid_point)['geometry'],
+                segments))
+
+        van_segs = [[] for _ in output_data]
+        for (vi, _, _), seg in zip(segments, seg_geoms):
+            if len(seg):
+                van_segs[vi].append(seg)
+
+        for r, segs in zip(output_data, van_segs):
+            if not segs:
+                continue
+            # Drop the first point of every segment that starts where the previous one ended
+            ends = np.array([seg[-1] for seg in segs[:-1]]).reshape(-1, 2)
+            starts = np.array([seg[0] for seg in segs[1:]]).reshape(-1, 2)
+            shared = np.all(ends == starts, axis=1)
+            parts = [segs[0]] + [seg[1:] if dup else seg for seg, dup in zip(segs[1:], shared)]
+            r['geometry'] = [tuple(p) for p in np.concatenate(parts).tolist()]
+
         # ── Fleet Analytics ──
         fleet_avg = fleet_total_potency / fleet_served if fleet_served > 0 else 0
         doses_saved = sum(1 for r in output_data for s in r['steps'] if s['tier'] != 0 and s['potency'] >= 60)
@@ -325,13 +541,15 @@ class IsotopeOptimizer:
             }
         }
 
-        os.makedirs("output", exist_ok=True)
-        with open("output/routes.json", "w") as f:
-            json.dump(payload, f, indent=2)
+        if write:
+            os.makedirs("output", exist_ok=True)
+            with open("output/routes.json", "wb") as f:
+                f.write(orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY))
 
         print(f"Exported: {fleet_served} served, {len(all_canceled)} canceled, "
               f"Avg: {fleet_avg:.1f}%, Cardiac: {cardiac_ready}, "
               f"Value preserved: ${total_preserved:,.0f}")
+        return payload
 
 
 if __name__ == "__main__":
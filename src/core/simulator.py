@@ -1,5 +1,4 @@
 import logging
-import json
 import time
 import math
 import sys
@@ -11,9 +10,11 @@ from typing import List
 # Add src to path - keeping for standalone execution if needed, but relative imports are preferred in package
 # sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
-from src.core.optimizer import IsotopeOptimizer
+from src.core.optimizer import IsotopeOptimizer, attach_route_columns
 from src.core.data_loader import Hospital, load_hospitals
-from src.core.distance_matrix import generate_distance_matrix, TfNSWClient, get_haversine_distance, Location
+from src.core._kernels import scan_disruptions
+from src.core.distance_matrix import (TfNSWClient, get_haversine_distance, Location,
+                                      reroute_duration_matrix)
 
 # Configure Logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -23,43 +24,44 @@ class TransportSimulator:
     def __init__(self):
         self.original_optimizer = IsotopeOptimizer()
         self.hospitals = self.original_optimizer.hospitals
-        
-    def interpolate_location(self, origin: Hospital, dest: Hospital, progress_fraction: float) -> Hospital:
-        """Calculates current lat/lon based on progress."""
-        new_lat = origin.lat + (dest.lat - origin.lat) * progress_fraction
-        new_lon = origin.lon + (dest.lon - origin.lon) * progress_fraction
-        return Hospital(
-            name=f"Van_Loc_EnRoute_{dest.name}",
-            lat=new_lat,
-            lon=new_lon,
-            tier=0, # Treated as source/depot for reroute
-            type="Mobile"
-        )
+        # Struct-of-arrays view of the hospital list plus O(1) name lookup
+        self._lat = self.original_optimizer.lats
+        self._lon = self.original_optimizer.lons
+        self._tier = self.original_optimizer.tiers
+        self._name_to_idx = {h.name: i for i, h in enumerate(self.hospitals)}
+        self._by_name = {h.name: h for h in self.hospitals}
         
     def find_route_to_disrupt(self, routes_data):
         """Finds a route going to a Tier 3 hospital (e.g., Orange/Dubbo/Wagga)."""
-        for route in routes_data:
-            vehicle_id = route['vehicle_id']
-            steps = route['steps']
-            for i in range(len(steps) - 1):
-                # Check if this leg goes to a Tier 3
-                dest_name = steps[i+1]['name']
-                dest_tier = steps[i+1]['tier']
-                if dest_tier == 3:
-                     logger.info(f"Targeting Vehicle {vehicle_id} en route to {dest_name} (Tier 3) for disruption.")
-                     return vehicle_id, route
-        return None, None
+        attach_route_columns(routes_data)  # no-op when run_simulation already did it
+        # Flatten every leg destination (steps[1:]) across the fleet, then locate the first Tier 3 in C
+        legs = [r['_tier'][1:] for r in routes_data]
+        if not any(len(l) for l in legs):
+            return None, None
+        tiers = np.concatenate(legs)
+        route_idx = np.repeat(np.arange(len(routes_data)), [len(l) for l in legs])
+        idx = int(np.argmax(tiers == 3))
+        if tiers[idx] != 3:
+            return None, None
+
+        route = routes_data[route_idx[idx]]
+        step_idx = idx - int(np.searchsorted(route_idx, route_idx[idx])) + 1
+        vehicle_id = route['vehicle_id']
+        logger.info("Targeting Vehicle %s en route to %s (Tier 3) for disruption.", vehicle_id, route['_names'][step_idx])
+        return vehicle_id, route
 
     def run_simulation(self):
         logger.info("Initializing Simulation...")
         
         # 1. Initial Solve
         logger.info("Solving initial Optimization Problem...")
-        self.original_optimizer.solve_and_report()
-        
-        # Parse output for routes
-        with open("output/routes.json", 'r') as f:
-            routes_data = json.load(f)
+        # Routes come back in memory; routes.json is left for the reroute to write
+        baseline = self.original_optimizer.solve_and_report(write=False)
+        if baseline is None:
+            logger.error("Baseline solve failed. Aborting.")
+            return
+        # Columnar copies of each route's steps for the leg search below
+        routes_data = attach_route_columns(baseline['routes'])
             
         # 2. Pick target route
         target_vid, target_route = self.find_route_to_disrupt(routes_data)
@@ -77,54 +79,62 @@ class TransportSimulator:
         current_node = None
         next_node = None
         
-        # Naive simulation: Find the leg active at 120 min
-        for i in range(len(steps) - 1):
-            start_time = steps[i]['arrival_time_min']
-            end_time = steps[i+1]['arrival_time_min']
+        # Locate every van's active leg at T=120 in one compiled pass over padded
+        # (routes, max_steps) arrays; rows past a route's end are +inf/NaN
+        n_routes = len(routes_data)
+        max_steps = max(len(r['_names']) for r in routes_data)
+        arrivals = np.full((n_routes, max_steps), np.inf)
+        step_lat = np.full((n_routes, max_steps), np.nan)
+        step_lon = np.full((n_routes, max_steps), np.nan)
+        for r, route in enumerate(routes_data):
+            k = len(route['_names'])
+            node_idx = [self._name_to_idx[name] for name in route['_names']]
+            arrivals[r, :k] = route['_arr']
+            step_lat[r, :k] = self._lat[node_idx]
+            step_lon[r, :k] = self._lon[node_idx]
+        leg_idx, fracs, van_lat, van_lon = scan_disruptions(arrivals, step_lat, step_lon, float(disruption_time_min))
+        logger.info("T=%smin: %d of %d vans between stops.", disruption_time_min, (leg_idx >= 0).sum(), n_routes)
+
+        target_row = next(r for r, route in enumerate(routes_data) if route is target_route)
+        i = int(leg_idx[target_row])
+        if i >= 0:
+            # Van is here
+            origin_name, dest_name = target_route['_names'][i:i+2]
+            
+            # Progress along the leg
+            fraction = float(fracs[target_row])
             
-            if start_time <= disruption_time_min < end_time:
-                # Van is here
-                origin_step = steps[i]
-                dest_step = steps[i+1]
-                
-                # Calculate progress
-                leg_duration = end_time - start_time
-                elapsed = disruption_time_min - start_time
-                fraction = elapsed / leg_duration if leg_duration > 0 else 0
-                
-                # Origin and Dest Objects
-                origin_h = next(h for h in self.hospitals if h.name == origin_step['name'])
-                dest_h = next(h for h in self.hospitals if h.name == dest_step['name'])
-                
-                current_van_loc = self.interpolate_location(origin_h, dest_h, fraction)
-                
-                logger.info(f"T=120min: Van {target_vid} is {(fraction*100):.1f}% along leg {origin_h.name} -> {dest_h.name}.")
-                
-                # 4. Trigger Black Swan
-                self.trigger_reroute(target_vid, current_van_loc, steps[i+1:], origin_h, dest_h)
-                break
+            # Origin and Dest Objects
+            origin_h = self._by_name[origin_name]
+            dest_h = self._by_name[dest_name]
+            
+            # The kernel already interpolated the van's position along the leg
+            current_van_loc = Hospital(
+                name=f"Van_Loc_EnRoute_{dest_name}",
+                lat=float(van_lat[target_row]),
+                lon=float(van_lon[target_row]),
+                tier=0, # Treated as source/depot for reroute
+                type="Mobile"
+            )
+            
+            logger.info("T=120min: Van %s is %.1f%% along leg %s -> %s.", target_vid, fraction*100, origin_h.name, dest_h.name)
+            
+            # 4. Trigger Black Swan
+            self.trigger_reroute(target_vid, current_van_loc, steps[i+1:], origin_h, dest_h)
         else:
             logger.warning("Van might have finished or hasn't started by T=120? Checking end state.")
 
     def trigger_reroute(self, vehicle_id, current_loc, remaining_steps, disrupted_origin, disrupted_dest):
-        logger.warning(f"BLACK SWAN EVENT: Major closure detected on M5/Great Western Hwy between {disrupted_origin.name} and {disrupted_dest.name}!")
+        logger.warning("BLACK SWAN EVENT: Major closure detected on M5/Great Western Hwy between %s and %s!", disrupted_origin.name, disrupted_dest.name)
         logger.warning("Spiking travel time by 400%...")
         
         # 1. Construct Reroute Problem
         # New "Depot" is current_loc
         # Remaining destinations
-        remaining_hospitals = [current_loc]
-        
         # Map remaining steps to Hospital objects
         # Note: remaining_steps[0] is the immediate destination current leg is aiming for.
         # remaining_steps include the rest of the route.
-        # We need to find these in the master list.
-        for step in remaining_steps:
-             # Be careful not to include duplicates if we loop back to ANSTO?
-             # But standard VRP usually doesn't revisit unless it's depot.
-             # step['name']
-             original_h = next(h for h in self.hospitals if h.name == step['name'])
-             remaining_hospitals.append(original_h)
+        remaining_hospitals = [current_loc, *(self._by_name[s['name']] for s in remaining_steps)]
              
         # 2. Generate Custom Matrix with Spike
         # We need to regenerate the matrix for this new subset of locations.
@@ -134,21 +144,25 @@ class TransportSimulator:
         # So we penalize "Current -> Immediate Dest" heavily.
         
         logger.info("Regenerating Distance Matrix for Reroute...")
-        loc_dicts = [{"lat": h.lat, "lon": h.lon, "tier": h.tier} for h in remaining_hospitals]
-        
         # Generate clean matrix first
-        new_matrix = generate_distance_matrix(loc_dicts, None)
+        base = self.original_optimizer.distance_matrix
+        idx = np.array([self._name_to_idx[h.name] for h in remaining_hospitals[1:]])
+        # Baseline durations between the remaining stops; only the van's own row/column is new
+        new_matrix = reroute_duration_matrix(base, self._lat, self._lon, self._tier, idx,
+                                             current_loc.lat, current_loc.lon)
         
         # Apply Spike
         # Index 0 is Current Loc. Index 1 correspond to remaining_steps[0] (Immediate Dest).
         # Spike (0 -> 1)
         original_time = new_matrix[0][1]
         new_matrix[0][1] *= 4.0 # 400%
-        logger.info(f"Travel time {current_loc.name} -> {remaining_hospitals[1].name} spiked from {original_time:.1f} to {new_matrix[0][1]:.1f} min.")
+        logger.info("Travel time %s -> %s spiked from %.1f to %.1f min.", current_loc.name, remaining_hospitals[1].name, original_time, new_matrix[0][1])
         
         # 3. Solve Reroute
         logger.info("Optimizer: Re-calculating path...")
-        reroute_optimizer = IsotopeOptimizer(hospitals_list=remaining_hospitals, custom_matrix=new_matrix)
+        # Whole-minute int32, contiguous: the fixed reroute arcs go straight into OR-Tools' callback cache
+        reroute_optimizer = IsotopeOptimizer(hospitals_list=remaining_hospitals,
+                                             custom_matrix=np.ascontiguousarray(np.rint(new_matrix), dtype=np.int32))
         # Force 1 vehicle for this reroute (it's a single van recovery)
         reroute_optimizer.num_vehicles = 1 
         reroute_optimizer.vehicle_capacity = 10 # Assume enough capacity
@@ -164,7 +178,7 @@ class TransportSimulator:
         # So "Projected Delay" on Original Path = (Spiked Time - Original Time).
         
         projected_delay = new_matrix[0][1] - original_time
-        logger.info(f"Projected Delay on Original Path: {projected_delay:.1f} min")
+        logger.info("Projected Delay on Original Path: %.1f min", projected_delay)
         
         # Check if Reroute found a better way?
         # The reroute result is in stdout/routes.json (overwritten).
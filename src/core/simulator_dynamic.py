@@ -1,19 +1,20 @@
 import logging
-import json
 import time
 import math
 import sys
 import os
 import io
-import matplotlib.pyplot as plt
+import threading
+from matplotlib.figure import Figure  # plain Figure: no pyplot state, no GUI backend
 import numpy as np
 from datetime import datetime, timedelta
 from typing import List
 
-from src.core.optimizer import IsotopeOptimizer
+from src.core.optimizer import IsotopeOptimizer, attach_route_columns
 from src.core.data_loader import Hospital, load_hospitals
-from src.core.distance_matrix import generate_distance_matrix, TfNSWClient, get_haversine_distance, Location
-from src.core.use_cases.decay_calculator import DecayCalculator
+from src.core.distance_matrix import (generate_distance_matrix_arr, TfNSWClient, get_haversine_distance,
+                                      Location, reroute_duration_matrix)
+from src.core.use_cases.decay_calculator import decay_activity
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("Simulator")
@@ -22,16 +23,38 @@ MIN_ACTIVITY_THRESHOLD = 0.25
 HALF_LIFE = 6.0
 INITIAL_ACTIVITY = 100.0
 
+# Tc-99m decay specialised for this scenario's fixed constants
+_DECAY_TC99M = math.log(2) / HALF_LIFE  # per hour
+
+
+# One decay-plot figure per process, reused across DynamicSimulator instances (the API
+# builds one per request); the lock keeps concurrent requests off the same axes
+_DECAY_FIG = None
+_DECAY_FIG_LOCK = threading.Lock()
+
+
+def _remaining_tc99m(t_min: float) -> float:
+    """Remaining activity after t_min minutes; no validation, t_min >= 0 by construction."""
+    return INITIAL_ACTIVITY * math.exp(-_DECAY_TC99M * t_min / 60.0)
+
+
 class DynamicSimulator:
     def __init__(self):
         self.original_optimizer = IsotopeOptimizer()
         self.hospitals = self.original_optimizer.hospitals
+        # Struct-of-arrays view of the hospital list plus O(1) name lookup
+        self._lat = self.original_optimizer.lats
+        self._lon = self.original_optimizer.lons
+        self._tier = self.original_optimizer.tiers
+        self._name_to_idx = {h.name: i for i, h in enumerate(self.hospitals)}
+        self._by_name = {h.name: h for h in self.hospitals}
 
-    def interpolate_location(self, origin: Hospital, dest: Hospital, progress_fraction: float) -> Hospital:
-        new_lat = origin.lat + (dest.lat - origin.lat) * progress_fraction
-        new_lon = origin.lon + (dest.lon - origin.lon) * progress_fraction
+    def interpolate_location(self, origin_idx: int, dest_idx: int, progress_fraction: float) -> Hospital:
+        o_lat, o_lon = self._lat[origin_idx], self._lon[origin_idx]
+        new_lat = float(o_lat + (self._lat[dest_idx] - o_lat) * progress_fraction)
+        new_lon = float(o_lon + (self._lon[dest_idx] - o_lon) * progress_fraction)
         return Hospital(
-            name=f"Van_Loc_EnRoute_{dest.name}",
+            name=f"Van_Loc_EnRoute_{self.hospitals[dest_idx].name}",
             lat=new_lat,
             lon=new_lon,
             tier=0,
@@ -43,18 +66,20 @@ class DynamicSimulator:
         
         # 1. Baseline Solve
         logger.info("Solving initial baseline...")
-        self.original_optimizer.solve_and_report()
-        
-        with open("output/routes.json", 'r') as f:
-            routes_data = json.load(f)
+        baseline = self.original_optimizer.solve_and_report(write=False)
+        if baseline is None:
+            logger.error("Baseline solve failed.")
+            return
+        # Columnar copies of each route's steps for the lookups below
+        routes_data = attach_route_columns(baseline['routes'])
             
         # 2. Identify Target Van
         target_vid = None
         target_route = None
         
         for r in routes_data:
-             steps = r['steps']
-             if len(steps) > 1 and "St George" in steps[0]['name']:
+             names = r['_names']
+             if len(names) > 1 and "St George" in names[0]:
                      target_vid = r['vehicle_id']
                      target_route = r
                      break
@@ -62,7 +87,7 @@ class DynamicSimulator:
         if target_vid is None:
             logger.info("Strict 'St George' route not found, picking first available Metro route.")
             for r in routes_data:
-                if len(r['steps']) > 0 and r['steps'][0]['tier'] == 1:
+                if len(r['_tier']) > 0 and r['_tier'][0] == 1:
                     target_vid = r['vehicle_id']
                     target_route = r
                     break
@@ -72,10 +97,11 @@ class DynamicSimulator:
              return
 
         # 3. Simulate T=45 min
-        logger.info(f"Simulating T=45 min for Van {target_vid}...")
+        logger.info("Simulating T=45 min for Van %s...", target_vid)
         
-        first_stop = target_route['steps'][0]
-        arrival_time = first_stop['arrival_time_min']
+        arrivals = target_route['_arr']
+        names = target_route['_names']
+        arrival_time = arrivals[0]
         
         current_loc = None
         next_dest_h = None
@@ -83,77 +109,82 @@ class DynamicSimulator:
         
         if 45 < arrival_time:
             fraction = 45.0 / arrival_time
-            origin_h = self.hospitals[0] # ANSTO
-            dest_h = next(h for h in self.hospitals if h.name == first_stop['name'])
-            current_loc = self.interpolate_location(origin_h, dest_h, fraction)
+            dest_idx = self._name_to_idx[names[0]]
+            dest_h = self._by_name[names[0]]
+            current_loc = self.interpolate_location(0, dest_idx, fraction) # from ANSTO
             next_dest_h = dest_h
             next_dest_idx = 0
         else:
-            if len(target_route['steps']) > 1:
-                prev_stop = target_route['steps'][0]
-                next_stop = target_route['steps'][1]
-                duration = next_stop['arrival_time_min'] - prev_stop['arrival_time_min']
-                elapsed = 45 - prev_stop['arrival_time_min']
+            if len(names) > 1:
+                duration = arrivals[1] - arrivals[0]
+                elapsed = 45 - arrivals[0]
                 fraction = elapsed / duration if duration > 0 else 0
                 
-                origin_h = next(h for h in self.hospitals if h.name == prev_stop['name'])
-                dest_h = next(h for h in self.hospitals if h.name == next_stop['name'])
+                origin_idx = self._name_to_idx[names[0]]
+                dest_idx = self._name_to_idx[names[1]]
+                dest_h = self._by_name[names[1]]
                 
-                current_loc = self.interpolate_location(origin_h, dest_h, fraction)
+                current_loc = self.interpolate_location(origin_idx, dest_idx, fraction)
                 next_dest_h = dest_h
                 next_dest_idx = 1
             else:
                 logger.warning("Route too short for T=45 simulation.")
                 return
 
-        logger.warning(f"BLACK SWAN: M5 Tunnel Closure detected at T=45! Ahead: {next_dest_h.name}")
+        logger.warning("BLACK SWAN: M5 Tunnel Closure detected at T=45! Ahead: %s", next_dest_h.name)
         
         # 4. Scenario A: Ignorant System
-        loc_dicts = [{"lat": current_loc.lat, "lon": current_loc.lon, "tier": 0}, 
-                     {"lat": next_dest_h.lat, "lon": next_dest_h.lon, "tier": next_dest_h.tier}]
-        matrix = generate_distance_matrix(loc_dicts, None)
+        matrix = generate_distance_matrix_arr(np.array([current_loc.lat, next_dest_h.lat]),
+                                              np.array([current_loc.lon, next_dest_h.lon]),
+                                              np.array([0, next_dest_h.tier]), None)
         base_time = matrix[0][1]
         
         # 1000% Penalty as requested (10x)
         spiked_time = base_time * 10.0 
         
         ignorant_arrival_time = 45 + spiked_time
-        ignorant_activity = DecayCalculator.calculate_remaining_activity(INITIAL_ACTIVITY, ignorant_arrival_time/60.0, HALF_LIFE)
+        ignorant_activity = _remaining_tc99m(ignorant_arrival_time)
         
-        logger.info(f"Option A (Ignorant): Arrive {next_dest_h.name} at T={ignorant_arrival_time:.1f} min. Activity: {ignorant_activity:.2f}%")
+        logger.info("Option A (Ignorant): Arrive %s at T=%.1f min. Activity: %.2f%%", next_dest_h.name, ignorant_arrival_time, ignorant_activity)
         
         # 5. Scenario B: Intelligent System (Reroute)
-        remaining_stops_names = [s['name'] for s in target_route['steps'][next_dest_idx:]]
+        remaining_stops_names = names[next_dest_idx:]
         remaining_hospitals = [current_loc]
         for name in remaining_stops_names:
-            h = next((x for x in self.hospitals if x.name == name), None)
+            h = self._by_name.get(name)
             if h: remaining_hospitals.append(h)
             
         logger.info("Optimizer: Rerouting with penalty logic...")
-        reroute_loc_dicts = [{"lat": h.lat, "lon": h.lon, "tier": h.tier} for h in remaining_hospitals]
-        reroute_matrix = generate_distance_matrix(reroute_loc_dicts, None)
+        base = self.original_optimizer.distance_matrix
+        idx = np.array([self._name_to_idx[h.name] for h in remaining_hospitals[1:]])
+        # Baseline durations between the remaining stops; only the van's own row/column is new
+        reroute_matrix = reroute_duration_matrix(base, self._lat, self._lon, self._tier, idx,
+                                                 current_loc.lat, current_loc.lon)
         
         # Apply Spike to next_dest (Index 1)
         reroute_matrix[0][1] = spiked_time
         
-        reroute_optimizer = IsotopeOptimizer(hospitals_list=remaining_hospitals, custom_matrix=reroute_matrix)
+        # Whole-minute int32, contiguous: the fixed reroute arcs go straight into OR-Tools' callback cache
+        reroute_optimizer = IsotopeOptimizer(hospitals_list=remaining_hospitals,
+                                             custom_matrix=np.ascontiguousarray(np.rint(reroute_matrix), dtype=np.int32))
         reroute_optimizer.num_vehicles = 1
         reroute_optimizer.vehicle_capacity = 10
         
-        reroute_optimizer.solve_and_report()
-        
-        with open("output/routes.json", 'r') as f:
-            reroute_data = json.load(f)
+        reroute_data = reroute_optimizer.solve_and_report(write=False)
+        if reroute_data is None:
+            logger.error("Reroute solve failed.")
+            return
             
-        intelligent_steps = reroute_data[0]['steps']
+        intelligent_steps = reroute_data['routes'][0]['steps']
         intelligent_next_node = intelligent_steps[0]['name'] if intelligent_steps else "None"
         
         dropped = next_dest_h.name not in [s['name'] for s in intelligent_steps]
         
-        logger.info(f"Option B (Intelligent): Next Stop -> {intelligent_next_node}")
+        logger.info("Option B (Intelligent): Next Stop -> %s", intelligent_next_node)
         
         self.generate_simulation_log(ignorant_arrival_time, ignorant_activity, intelligent_steps, next_dest_h, dropped)
         self.plot_decay_curve(ignorant_arrival_time, next_dest_h.name)
+        return reroute_data
 
     def generate_simulation_log(self, ignorant_time, ignorant_activity, intelligent_steps, target_hospital, dropped):
         log = f"""# Simulation Log: M5 Black Swan Event
@@ -179,23 +210,34 @@ class DynamicSimulator:
         logger.info("Simulation Log generated: simulation_log.md")
 
     def plot_decay_curve(self, disrupted_arrival_time, hospital_name):
+        if os.environ.get("NM_PLOT", "1") != "1":
+            return  # batch/headless sweeps opt out with NM_PLOT=0
         t = np.linspace(0, disrupted_arrival_time + 60, 100) 
-        lambda_val = math.log(2) / HALF_LIFE
-        activity = INITIAL_ACTIVITY * np.exp(-lambda_val * (t / 60.0))
-        
-        plt.figure(figsize=(10, 6))
-        plt.plot(t, activity, label='Isotope Decay (Tc-99m)', color='blue')
-        plt.axvline(x=45, color='orange', linestyle='--', label='Disruption (T=45)')
-        plt.axvline(x=disrupted_arrival_time, color='red', linestyle='-.', label=f'Ignorant Arrival (T={int(disrupted_arrival_time)})')
-        plt.scatter([disrupted_arrival_time], [INITIAL_ACTIVITY * math.exp(-lambda_val * disrupted_arrival_time/60)], color='red')
-        plt.axhline(y=MIN_ACTIVITY_THRESHOLD*100, color='gray', linestyle=':', label='Futility Threshold')
-        
-        plt.title(f"Decay Profile: Route to {hospital_name}")
-        plt.xlabel("Time (minutes)")
-        plt.ylabel("Activity (%)")
-        plt.legend()
-        plt.grid(True)
-        plt.savefig("output/decay_plot.png")
+        # Minutes -> hours -> activity, in place in one buffer
+        activity = np.empty_like(t)
+        np.multiply(t, 1 / 60.0, out=activity)
+        decay_activity(INITIAL_ACTIVITY, activity, HALF_LIFE, out=activity)
+        arrival_activity = _remaining_tc99m(disrupted_arrival_time)
+        
+        global _DECAY_FIG
+        with _DECAY_FIG_LOCK:
+            if _DECAY_FIG is None:
+                _DECAY_FIG = Figure(figsize=(10, 6))
+                _DECAY_FIG.add_subplot()
+            ax = _DECAY_FIG.axes[0]
+            ax.clear()
+            ax.plot(t, activity, label='Isotope Decay (Tc-99m)', color='blue')
+            ax.axvline(x=45, color='orange', linestyle='--', label='Disruption (T=45)')
+            ax.axvline(x=disrupted_arrival_time, color='red', linestyle='-.', label=f'Ignorant Arrival (T={int(disrupted_arrival_time)})')
+            ax.scatter([disrupted_arrival_time], [arrival_activity], color='red')
+            ax.axhline(y=MIN_ACTIVITY_THRESHOLD*100, color='gray', linestyle=':', label='Futility Threshold')
+        
+            ax.set_title(f"Decay Profile: Route to {hospital_name}")
+            ax.set_xlabel("Time (minutes)")
+            ax.set_ylabel("Activity (%)")
+            ax.legend()
+            ax.grid(True)
+            _DECAY_FIG.savefig("output/decay_plot.png")
         logger.info("Decay plot saved: output/decay_plot.png")
 
 if __name__ == "__main__":
@@ -1,4 +1,22 @@
 import math
+from functools import lru_cache
+
+from numba import vectorize
+
+_LN2 = math.log(2)
+
+
+@lru_cache(maxsize=8)
+def _lam(half_life_hours: float) -> float:
+    """Decay constant ln(2) / half_life (per hour)."""
+    return _LN2 / half_life_hours
+
+
+@vectorize(['float64(float64, float64, float64)'], fastmath=True)
+def decay_activity(initial_activity, time_elapsed_hours, half_life_hours):
+    """A_0 * e^(-ln(2) / half_life * t) as a NumPy ufunc for arrays of times; scalars use DecayCalculator."""
+    return initial_activity * math.exp(-_LN2 / half_life_hours * time_elapsed_hours)
+
 
 class DecayCalculator:
     """
@@ -27,6 +45,5 @@ class DecayCalculator:
         if time_elapsed_hours < 0:
              raise ValueError("Time elapsed cannot be negative.")
 
-        decay_constant = math.log(2) / half_life_hours
-        remaining_activity = initial_activity * math.exp(-decay_constant * time_elapsed_hours)
-        return remaining_activity
+        # Plain math.exp: a ufunc dispatch costs ~10x more than the formula for one scalar
+        return initial_activity * math.exp(-_lam(half_life_hours) * time_elapsed_hours)
@@ -6,7 +6,9 @@ import os
 # Add src to the system path to allow imports
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../../src')))
 
-from core.use_cases.decay_calculator import DecayCalculator
+import numpy as np
+
+from core.use_cases.decay_calculator import DecayCalculator, decay_activity
 
 class TestDecayCalculator(unittest.TestCase):
     
@@ -49,5 +51,11 @@ class TestDecayCalculator(unittest.TestCase):
         with self.assertRaises(ValueError):
             DecayCalculator.calculate_remaining_activity(100.0, 5.0, 0.0)
 
+    def test_decay_activity_broadcasts(self):
+        """Test that the ufunc form matches the scalar path over an array of times."""
+        t = np.array([0.0, 3.0, 6.0, 12.0])
+        expected = [DecayCalculator.calculate_remaining_activity(100.0, x, 6.0) for x in t]
+        np.testing.assert_allclose(decay_activity(100.0, t, 6.0), expected)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import sys
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+# Add repo root to path (the API imports through the src.core package)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from fastapi.testclient import TestClient
+
+import src.api as api
+
+PAYLOAD = {"routes": [{"vehicle_id": 0, "steps": []}], "analytics": {"fleet": {}}}
+
+
+class TestOptimizeJobs(unittest.TestCase):
+
+    def setUp(self):
+        # Threads instead of worker processes so patched solvers are visible to the jobs
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        patches = [patch.object(api, '_EXECUTOR', self.executor), patch.dict(api._JOBS, clear=True)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.addCleanup(self.executor.shutdown)
+        self.client = TestClient(api.app)
+
+    def _wait_done(self, job_id):
+        api._JOBS[job_id][0].exception(timeout=5)  # blocks until finished; doesn't raise
+
+    def test_job_lifecycle(self):
+        """Test submit -> PENDING, poll -> DONE with the payload, then the job is gone."""
+        release = threading.Event()
+
+        def solver(avoid):
+            release.wait(5)
+            return PAYLOAD
+
+        with patch.object(api, 'run_optimizer', side_effect=solver):
+            submitted = self.client.post("/optimize").json()
+            self.assertEqual(submitted["status"], "PENDING")
+            job_id = submitted["job_id"]
+
+            self.assertIn(self.client.get(f"/optimize/{job_id}").json()["status"], ("PENDING", "RUNNING"))
+            release.set()
+            self._wait_done(job_id)
+
+            done = self.client.get(f"/optimize/{job_id}")
+            self.assertEqual(done.status_code, 200)
+            self.assertEqual(done.json(), {"job_id": job_id, "status": "DONE", **PAYLOAD})
+            self.assertEqual(self.client.get(f"/optimize/{job_id}").status_code, 404)
+
+    def test_failed_job(self):
+        """Test that a solver error is reported once as a 500, then evicted."""
+        with patch.object(api, 'run_optimizer', side_effect=RuntimeError("no solution")):
+            job_id = self.client.post("/optimize").json()["job_id"]
+            self._wait_done(job_id)
+            failed = self.client.get(f"/optimize/{job_id}")
+            self.assertEqual(failed.status_code, 500)
+            self.assertEqual(failed.json()["detail"], "no solution")
+            self.assertNotIn(job_id, api._JOBS)
+
+    def test_unfetched_job_expires(self):
+        """Test that finished jobs nobody fetched are purged JOB_TTL_S after submission."""
+        with patch.object(api, 'run_optimizer', return_value=PAYLOAD):
+            stale = self.client.post("/optimize").json()["job_id"]
+            self._wait_done(stale)
+            with patch.object(api, 'JOB_TTL_S', -1):
+                fresh = self.client.post("/optimize").json()["job_id"]
+            self.assertNotIn(stale, api._JOBS)
+            self.assertIn(fresh, api._JOBS)
+            self.assertEqual(self.client.get(f"/optimize/{stale}").status_code, 404)
+
+if __name__ == '__main__':
+    unittest.main()
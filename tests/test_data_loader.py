@@ -21,6 +21,13 @@ class TestDataLoader(unittest.TestCase):
         hospitals = load_hospitals(self.file_path)
         self.assertEqual(len(hospitals), 21, "Should load exactly 21 locations")
 
+    def test_load_hospitals_cached(self):
+        """Verify repeated loads reuse the parsed file but hand back independent lists."""
+        first = load_hospitals(self.file_path)
+        second = load_hospitals(self.file_path)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+
     def test_ansto_loading(self):
         """Verify ANSTO (Source) is loaded correctly."""
         hospitals = load_hospitals(self.file_path)
@@ -40,6 +47,11 @@ class TestDataLoader(unittest.TestCase):
         self.assertEqual(h2.get_priority_weight(), 2.0)
         self.assertEqual(h1.get_priority_weight(), 3.0)
 
+    def test_invalid_tier(self):
+        """Verify an unknown tier is rejected at construction."""
+        with self.assertRaises(ValueError):
+            Hospital(name="T9", lat=0, lon=0, tier=9, type="Unknown")
+
     def test_wagga_correction(self):
         """Verify the data hygiene fix for Wagga Wagga (Tier 3)."""
         hospitals = load_hospitals(self.file_path)
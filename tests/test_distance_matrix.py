@@ -7,7 +7,10 @@ import os
 # Add src to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
-from distance_matrix import generate_distance_matrix, get_haversine_distance, calculate_duration_fallback, Location, TfNSWClient
+from distance_matrix import (generate_distance_matrix, get_haversine_distance, calculate_duration_fallback, Location,
+                             TfNSWClient, _is_segment_near_point, generate_distance_matrix_arr,
+                             fetch_osrm_route_data, _fetch_osrm_route_cached, RateLimiter,
+                             calculate_duration_fallback_arr, reroute_duration_matrix)
 
 class TestDistanceMatrix(unittest.TestCase):
 
@@ -47,7 +50,29 @@ class TestDistanceMatrix(unittest.TestCase):
         self.assertEqual(matrix[0][0], 0.0)
         self.assertGreater(matrix[0][1], 0.0)
 
-    @patch('distance_matrix.requests.get')
+    def test_matrix_fallback_matches_scalar(self):
+        """Verify the vectorised fallback matches the per-cell Haversine estimate."""
+        matrix = generate_distance_matrix(self.locations, client=None)
+        for i, o in enumerate(self.locations):
+            for j, d in enumerate(self.locations):
+                if i == j:
+                    self.assertEqual(matrix[i][j], 0.0)
+                    continue
+                dist = get_haversine_distance(Location(o['lat'], o['lon']), Location(d['lat'], d['lon']))
+                expected = calculate_duration_fallback(dist, d['tier'])
+                self.assertAlmostEqual(matrix[i][j], expected, places=6)
+
+    def test_segment_near_point(self):
+        """Verify the compiled segment/incident proximity check."""
+        o = Location(-34.0, 150.0)
+        d = Location(-35.0, 150.0)
+        # Midpoint of the segment is on the line
+        self.assertTrue(_is_segment_near_point(o, d, -34.5, 150.0))
+        # ~9km east of the line, outside the default 2km radius
+        self.assertFalse(_is_segment_near_point(o, d, -34.5, 150.1))
+        self.assertTrue(_is_segment_near_point(o, d, -34.5, 150.1, radius_km=10.0))
+
+    @patch('distance_matrix._SESSION.get')
     def test_api_integration_mock(self, mock_get):
         """Verify API client is called and rate limiting is applied (implicitly)."""
         # Mock 200 OK response
@@ -68,7 +93,7 @@ class TestDistanceMatrix(unittest.TestCase):
         # (0,1) and (1,0) should be called.
         self.assertEqual(mock_get.call_count, 2)
 
-    @patch('distance_matrix.requests.get')
+    @patch('distance_matrix._SESSION.get')
     def test_api_401_fallback(self, mock_get):
         """Verify fallback to Haversine on API 401 error."""
         mock_response = MagicMock()
@@ -84,5 +109,122 @@ class TestDistanceMatrix(unittest.TestCase):
         self.assertEqual(matrix.shape, (2, 2))
         self.assertGreater(matrix[0][1], 0.0)
 
+    @patch('distance_matrix._SESSION.get')
+    def test_osrm_table_with_unreachable_cell(self, mock_get):
+        """Verify one OSRM table call fills the matrix and null cells keep the fallback."""
+        mock_response = MagicMock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {
+            'code': 'Ok',
+            'durations': [[0, 600, None], [600, 0, 1200], [None, 1200, 0]]
+        }
+        mock_get.return_value = mock_response
+
+        lats = [l['lat'] for l in self.locations]
+        lons = [l['lon'] for l in self.locations]
+        tiers = [l['tier'] for l in self.locations]
+        matrix = generate_distance_matrix_arr(lats, lons, tiers, osrm=True)
+        fallback = generate_distance_matrix(self.locations, client=None)
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertAlmostEqual(matrix[0][1], 10.0)
+        self.assertAlmostEqual(matrix[1][2], 20.0)
+        self.assertAlmostEqual(matrix[0][2], fallback[0][2])
+
+    @patch('distance_matrix._SESSION.get')
+    def test_osrm_table_failure_not_routed(self, mock_get):
+        """Verify a failed OSRM table is reported so the fallback is never cached as routed."""
+        mock_get.side_effect = Exception("network down")
+        lats = [l['lat'] for l in self.locations]
+        lons = [l['lon'] for l in self.locations]
+        tiers = [l['tier'] for l in self.locations]
+
+        with patch('sys.stdout', new=MagicMock()):
+            matrix, routed = generate_distance_matrix_arr(lats, lons, tiers, osrm=True, return_routed=True)
+
+        self.assertFalse(routed)
+        np.testing.assert_allclose(matrix, generate_distance_matrix(self.locations, client=None))
+
+    def test_reroute_matrix_matches_fresh_subset(self):
+        """Verify the sliced reroute matrix equals a fresh fallback matrix over [van, *stops]."""
+        lats = np.array([l['lat'] for l in self.locations])
+        lons = np.array([l['lon'] for l in self.locations])
+        tiers = np.array([l['tier'] for l in self.locations])
+        base = generate_distance_matrix(self.locations, client=None)
+        van = {'name': 'Van', 'lat': -34.05, 'lon': 150.05, 'tier': 0}
+        idx = np.array([2, 1])
+
+        spliced = reroute_duration_matrix(base, lats, lons, tiers, idx, van['lat'], van['lon'])
+        fresh = generate_distance_matrix([van] + [self.locations[i] for i in idx], client=None)
+        np.testing.assert_allclose(spliced, fresh)
+
+    @patch('distance_matrix._SESSION.get')
+    def test_partial_tfnsw_not_routed(self, mock_get):
+        """Verify TfNSW alone only counts as routed when every off-diagonal cell answered."""
+        mock_get.side_effect = Exception("network down")
+        lats = [l['lat'] for l in self.locations]
+        lons = [l['lon'] for l in self.locations]
+        tiers = [l['tier'] for l in self.locations]
+        client = MagicMock(token="token")
+
+        with patch('sys.stdout', new=MagicMock()):
+            client.get_trip_duration.side_effect = lambda o, d: None if o.lat == -35.0 else 30.0
+            _, partial = generate_distance_matrix_arr(lats, lons, tiers, client, osrm=True, return_routed=True)
+            client.get_trip_duration.side_effect = lambda o, d: 30.0
+            _, full = generate_distance_matrix_arr(lats, lons, tiers, client, osrm=True, return_routed=True)
+
+        self.assertFalse(partial)
+        self.assertTrue(full)
+
+    @patch('distance_matrix._SESSION.get')
+    def test_osrm_route_memoised(self, mock_get):
+        """Verify repeat segment requests hit the cache and failures are not cached."""
+        _fetch_osrm_route_cached.cache_clear()
+        failed = MagicMock()
+        failed.status_code = 429
+        ok = MagicMock()
+        ok.status_code = 200
+        ok.json.return_value = {'code': 'Ok', 'routes': [
+            {'duration': 600, 'distance': 5000, 'geometry': '_p~iF~ps|U_ulLnnqC'}]}
+        mock_get.side_effect = [failed, ok]
+
+        o, d = Location(-34.0, 150.0), Location(-34.1, 150.1)
+        first = fetch_osrm_route_data(o, d)
+        second = fetch_osrm_route_data(o, d)
+        third = fetch_osrm_route_data(Location(-34.000001, 150.0), d)
+
+        self.assertEqual(len(first['geometry']), 2)  # haversine fallback
+        self.assertAlmostEqual(second['duration_min'], 10.0)
+        self.assertEqual(third, second)
+        self.assertEqual(mock_get.call_count, 2)
+
+    def test_duration_fallback_arr_matches_scalar(self):
+        """Verify the array fallback matches the scalar one, per-cell tiers and a scalar tier alike."""
+        dist = np.array([5.0, 40.0, 120.0, 7.5])
+        tiers = np.array([1, 2, 3, 0])
+        expected = [calculate_duration_fallback(d, t) for d, t in zip(dist, tiers)]
+        np.testing.assert_allclose(calculate_duration_fallback_arr(dist, tiers), expected)
+        np.testing.assert_allclose(calculate_duration_fallback_arr(dist, 0),
+                                   [calculate_duration_fallback(d, 0) for d in dist])
+
+    def test_rate_limiter_blocks_only_when_full(self):
+        """Verify the limiter sleeps only once the window is full, and just until the oldest call expires."""
+        now = [0.0]  # fake clock: sleep() advances it, so no real waiting or wall-clock bounds
+        clock = MagicMock()
+        clock.monotonic.side_effect = lambda: now[0]
+        clock.sleep.side_effect = lambda s: now.__setitem__(0, now[0] + s)
+        limiter = RateLimiter(max_calls=4, period=0.2)
+
+        with patch('distance_matrix.time', clock):
+            for _ in range(4):
+                with limiter:
+                    pass
+            clock.sleep.assert_not_called()
+            with limiter:
+                pass
+
+        clock.sleep.assert_called_once()
+        self.assertAlmostEqual(clock.sleep.call_args[0][0], 0.2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+import sys
+import os
+
+# Add repo root to path (kernels are imported through the src.core package, as the app does)
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.core._kernels import decode_polyline, scan_disruptions
+
+class TestKernels(unittest.TestCase):
+
+    def test_scan_disruptions(self):
+        inf, nan = np.inf, np.nan
+        arrivals = np.array([
+            [0.0, 100.0, 200.0],   # mid second leg at T=150
+            [0.0, 60.0, inf],      # finished by T=150
+            [0.0, 300.0, inf],     # 50% along first leg
+        ])
+        lat = np.array([[0.0, 1.0, 3.0], [0.0, 1.0, nan], [0.0, 2.0, nan]])
+        lon = np.array([[0.0, 0.0, 0.0], [0.0, 1.0, nan], [0.0, 4.0, nan]])
+
+        leg_idx, frac, van_lat, van_lon = scan_disruptions(arrivals, lat, lon, 150.0)
+
+        np.testing.assert_array_equal(leg_idx, [1, -1, 0])
+        self.assertAlmostEqual(frac[0], 0.5)
+        self.assertAlmostEqual(van_lat[0], 2.0)
+        self.assertTrue(np.isnan(van_lat[1]))
+        self.assertAlmostEqual(van_lat[2], 1.0)
+        self.assertAlmostEqual(van_lon[2], 2.0)
+
+    def test_decode_polyline(self):
+        buf = lambda s: np.frombuffer(s.encode('ascii'), dtype=np.uint8)
+        # Reference example from the encoded polyline format spec
+        pts = decode_polyline(buf("_p~iF~ps|U_ulLnnqC_mqNvxq`@"))
+        np.testing.assert_allclose(pts, [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]])
+        # Cut mid-varint, and after a lat with no lon
+        for s in ("_p~iF~ps|U_ulLnnqC_mqNvxq", "_p~iF"):
+            with self.assertRaises(ValueError):
+                decode_polyline(buf(s))
+
+if __name__ == '__main__':
+    unittest.main()
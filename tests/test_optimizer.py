@@ -2,22 +2,31 @@ import unittest
 import sys
 import os
 import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import MagicMock, patch
 import numpy as np
 
 # Add src to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../src')))
 
-from optimizer import IsotopeOptimizer, load_hospitals, Hospital
+from optimizer import (IsotopeOptimizer, load_hospitals, Hospital, attach_route_columns,
+                       _load_detours, _store_detours)
 
 class TestOptimizer(unittest.TestCase):
 
     def setUp(self):
-        # We don't need real setup, mocks will handle it
-        pass
+        # Mocks handle the data; run in a scratch dir so caches and routes.json stay out of the repo
+        self._tmp = tempfile.TemporaryDirectory()
+        self._cwd = os.getcwd()
+        os.chdir(self._tmp.name)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
 
     @patch('optimizer.load_hospitals')
-    @patch('optimizer.generate_distance_matrix')
+    @patch('optimizer.generate_distance_matrix_arr')
     def test_solve_simple_case(self, mock_gen_matrix, mock_load):
         # Mock Data
         h0 = Hospital("Source", -34.0, 150.0, 0, "Source")
@@ -36,9 +45,9 @@ class TestOptimizer(unittest.TestCase):
             [10.0, 0.0, 40.0],
             [50.0, 40.0, 0.0]
         ])
-        mock_gen_matrix.return_value = matrix
+        mock_gen_matrix.return_value = (matrix, False)
         
-        optimizer = IsotopeOptimizer("dummy.json")
+        optimizer = IsotopeOptimizer("dummy.json", cache_dir=self._tmp.name)
         optimizer.num_vehicles = 1 # Force single vehicle to visit both
         
         # Capture stdout to avoid clutter
@@ -59,7 +68,7 @@ class TestOptimizer(unittest.TestCase):
             self.assertIn("Dest2", names)
 
     @patch('optimizer.load_hospitals')
-    @patch('optimizer.generate_distance_matrix')
+    @patch('optimizer.generate_distance_matrix_arr')
     def test_no_solution_case(self, mock_gen_matrix, mock_load):
         # Setup scenario where time constraint is violated impossibly
         h0 = Hospital("Source", 0, 0, 0, "Source")
@@ -71,9 +80,9 @@ class TestOptimizer(unittest.TestCase):
             [0.0, 2000.0],
             [2000.0, 0.0]
         ])
-        mock_gen_matrix.return_value = matrix
+        mock_gen_matrix.return_value = (matrix, False)
         
-        optimizer = IsotopeOptimizer("dummy.json")
+        optimizer = IsotopeOptimizer("dummy.json", cache_dir=self._tmp.name)
         
         with patch('sys.stdout', new=MagicMock()) as fake_out:
             optimizer.solve_and_report()
@@ -81,5 +90,89 @@ class TestOptimizer(unittest.TestCase):
             # We can check specific calls but verifying it doesn't crash is good enough for now.
             pass
 
+    def test_attach_route_columns(self):
+        """Test the columnar step view is stamped once and left alone on repeat calls."""
+        routes = [{'vehicle_id': 0, 'steps': [{'name': "Source", 'tier': 0, 'arrival_time_min': 0},
+                                              {'name': "Dest1", 'tier': 3, 'arrival_time_min': 42}]}]
+        attach_route_columns(routes)
+        first = routes[0]['_arr']
+        np.testing.assert_array_equal(first, [0.0, 42.0])
+        self.assertEqual(routes[0]['_names'], ["Source", "Dest1"])
+        np.testing.assert_array_equal(routes[0]['_tier'], [0, 3])
+        self.assertIs(attach_route_columns(routes)[0]['_arr'], first)
+
+    @patch('optimizer.fetch_osrm_route_data')
+    def test_detour_durations_applied_and_cached(self, mock_fetch):
+        """Test only arcs through the incident take max(original, detour), and repeats hit the cache."""
+        hospitals = [Hospital("Source", -34.0, 150.0, 0, "Source"),
+                     Hospital("Dest1", -34.0, 150.2, 1, "Metro"),
+                     Hospital("Dest2", -34.5, 151.0, 3, "Remote")]
+        matrix = np.array([[0.0, 10.0, 90.0], [10.0, 0.0, 80.0], [90.0, 80.0, 0.0]])
+        incident = {'lat': -34.0, 'lon': 150.1}  # midpoint of Source <-> Dest1
+        # Source -> Dest1 detour is longer than the baseline, Dest1 -> Source shorter
+        mock_fetch.side_effect = lambda o, d, detour_wp=None: {
+            'duration_min': 25.0 if o.lon == 150.0 else 5.0, 'detoured': True}
+        apply = lambda: IsotopeOptimizer(hospitals_list=hospitals, custom_matrix=matrix.copy(),
+                                         cache_dir=self._tmp.name)
+
+        with patch('sys.stdout', new=MagicMock()):
+            first = apply()
+            first._apply_osrm_detour_durations(incident)
+            self.assertEqual(mock_fetch.call_count, 2)
+
+            mock_fetch.reset_mock()
+            again = apply()
+            again._apply_osrm_detour_durations(incident)
+            mock_fetch.assert_not_called()
+
+        expected = matrix.copy()
+        expected[0, 1] = 25.0  # Dest1 -> Source keeps its original 10
+        np.testing.assert_array_equal(first.distance_matrix, expected)
+        np.testing.assert_array_equal(again.distance_matrix, expected)
+
+    def test_detour_cache_round_trip(self):
+        """Test the SQLite detour store returns only stored keys, with later writes replacing earlier ones."""
+        path = os.path.join(self._tmp.name, "detours.sqlite")
+        _store_detours(path, {"a": (12.5, True)})
+        _store_detours(path, {"a": (13.0, True), "b": (7.0, True)})
+        self.assertEqual(_load_detours(path, ["a", "b", "missing"]), {"a": (13.0, True), "b": (7.0, True)})
+
+    def test_model_skeleton_reused(self):
+        """Test the same fixed matrix reuses the model and a different one gets fresh arcs."""
+        hospitals = [Hospital("Source", -34.0, 150.0, 0, "Source"),
+                     Hospital("Dest1", -34.1, 150.1, 1, "Metro")]
+        solve = lambda m: IsotopeOptimizer(hospitals_list=hospitals,
+                                           custom_matrix=np.array(m, dtype=np.int32)).solve_and_report(write=False)
+
+        IsotopeOptimizer._build_model.cache_clear()
+        with patch('sys.stdout', new=MagicMock()):
+            first = solve([[0, 10], [10, 0]])
+            again = solve([[0, 10], [10, 0]])
+            second = solve([[0, 25], [25, 0]])
+
+        # Same fixed matrix reuses the model; a different one must not see cached arcs
+        info = IsotopeOptimizer._build_model.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 2))
+        arrival = lambda p: [s for r in p['routes'] for s in r['steps'] if s['name'] == "Dest1"][0]['arrival_time_min']
+        self.assertEqual(arrival(first), 10)
+        self.assertEqual(arrival(again), 10)
+        self.assertEqual(arrival(second), 25)
+
+    @patch('optimizer.fetch_osrm_route_data', return_value={'geometry': []})
+    @patch('optimizer.generate_distance_matrix_arr')
+    def test_shared_skeleton_concurrent_solves(self, mock_gen_matrix, _mock_geom):
+        """Test concurrent solves on one shared skeleton each see their own arcs."""
+        # Baseline optimizers over the same hospitals share one cached skeleton
+        hospitals = [Hospital("Source", -34.0, 150.0, 0, "Source"),
+                     Hospital("Dest1", -34.1, 150.1, 1, "Metro")]
+        mock_gen_matrix.side_effect = [(np.array([[0.0, m], [m, 0.0]]), False) for m in (10.0, 25.0) * 4]
+        with patch('sys.stdout', new=MagicMock()):
+            optimizers = [IsotopeOptimizer(hospitals_list=hospitals, cache_dir=self._tmp.name) for _ in range(8)]
+            with ThreadPoolExecutor(max_workers=8) as ex:
+                results = list(ex.map(lambda o: o.solve_and_report(write=False), optimizers))
+
+        arrival = lambda p: [s for r in p['routes'] for s in r['steps'] if s['name'] == "Dest1"][0]['arrival_time_min']
+        self.assertEqual([arrival(r) for r in results], [10, 25] * 4)
+
 if __name__ == '__main__':
     unittest.main()